@@ -0,0 +1,184 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import resource
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import pillar_tracker
+from utils.simulator import NetworkSimulator, SimulatorServer
+
+# Probability of each event per tick in random scenarios
+DEFAULT_RATES = {'rename': 0.05, 'reward_share': 0.1, 'create': 0.02, 'dismantle': 0.02,
+                 'epoch': 0.01, 'outage': 0.02, 'outage_fraction': 0.2, 'recover': 0.05}
+
+
+def create_config(server, profiles, record_file=None):
+    cfg = {'node_url_http': server.url, 'node_url_ws': '', 'telegram_api_base_url': server.url,
+           'telegram_bot_api_key': 'benchmark', 'telegram_channel_id': '@benchmark',
+           'telegram_pinned_message_id': 1, 'telegram_dev_chat_id': '',
+           'discord_channel_webhook': f'{server.url}/webhook/benchmark',
+           'reference_reward_address': 'z1qqbenchmark', 'daemon_checkpoint_interval': 60,
+           'pinned_message_min_edit_interval': 0,
+           # Send every event as its own message, the events are counted from the sent messages
+           'notification_digest_window': 0,
+           'telegram_messages_per_minute': 600000, 'discord_messages_per_minute': 600000}
+    if record_file is not None:
+        cfg['snapshot_record_file'] = record_file
+    if profiles > 1:
+        cfg['profiles'] = [{'name': f'profile{i}', 'telegram_channel_id': f'@benchmark{i}'}
+                           for i in range(profiles)]
+    return cfg
+
+
+def get_percentile(values, percentile):
+    if len(values) == 0:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile))]
+
+
+def run_ticks(args, trace_memory=False):
+    # Run the tracker for all ticks against a new simulator. The same seed results in the same events.
+    simulator = NetworkSimulator(pillar_count=args.pillars,
+                                 momentums_per_epoch=args.momentums_per_epoch, seed=args.seed)
+    server = SimulatorServer(simulator, latency=args.latency)
+    server.start()
+
+    script = None
+    if args.script is not None:
+        script = pillar_tracker.read_file(args.script)
+
+    rates = dict(DEFAULT_RATES, momentums=args.momentums_per_tick)
+    data_dir = tempfile.mkdtemp(prefix='pillar-tracker-benchmark-')
+    cfg = create_config(server, args.profiles, args.record if not trace_memory else None)
+
+    # The tracker prints every delivered message. Hide the output unless requested.
+    if args.verbose:
+        output = contextlib.nullcontext()
+    else:
+        output = contextlib.redirect_stdout(io.StringIO())
+
+    if trace_memory:
+        tracemalloc.start()
+    with output:
+        trackers = pillar_tracker.create_trackers(cfg, data_dir, daemon=True)
+        groups = pillar_tracker.get_tracker_groups(trackers)
+        states = {}
+        for tracker in trackers:
+            states[tracker['name']] = pillar_tracker.load_state(tracker['store'])
+            states[tracker['name']]['last_checkpoint'] = time.monotonic()
+
+        # Measure the time of the node round trip separately from the whole tick
+        poll_latencies = []
+        for trackers_in_group in groups:
+            node = trackers_in_group[0]['node']
+
+            def timed_get_poll_data(reward_addresses, get_poll_data=node.get_poll_data):
+                start = time.perf_counter()
+                r = get_poll_data(reward_addresses)
+                poll_latencies.append(time.perf_counter() - start)
+                return r
+            node.get_poll_data = timed_get_poll_data
+
+        tick_latencies = []
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            if script is not None:
+                simulator.apply(script[tick % len(script)])
+            else:
+                simulator.apply_random(rates)
+
+            tick_start = time.perf_counter()
+            for trackers_in_group in groups:
+                pillar_tracker.run_daemon_tick(trackers_in_group, states)
+            tick_latencies.append(time.perf_counter() - tick_start)
+        detection_time = time.perf_counter() - start
+
+        for tracker in trackers:
+            tracker['dispatcher'].join()
+        total_time = time.perf_counter() - start
+
+        for tracker in trackers:
+            pillar_tracker.save_state(states[tracker['name']], tracker['store'])
+
+    peak_memory = None
+    if trace_memory:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    server.stop()
+
+    # Every event is sent to the channel of every profile. Count the events of the first profile.
+    channel_id = pillar_tracker.get_profiles(cfg)[0]['telegram_channel_id']
+    events = len([m for m in server.messages if m[1] == 'sendMessage' and m[2] == channel_id])
+    return {'poll_latencies': poll_latencies, 'tick_latencies': tick_latencies, 'detection_time': detection_time,
+            'total_time': total_time, 'counts': server.get_counts(), 'events': events, 'peak_memory': peak_memory,
+            'data_dir': data_dir}
+
+
+def run_benchmark(args):
+    # tracemalloc slows down every allocation. The latencies are measured without it and the peak
+    # memory in a second run of the same ticks.
+    r = run_ticks(args)
+    peak_memory = run_ticks(args, trace_memory=True)['peak_memory']
+
+    poll_latencies = r['poll_latencies']
+    tick_latencies = r['tick_latencies']
+    counts = r['counts']
+    messages = counts['telegram_send'] + counts['telegram_edit'] + counts['discord']
+    return {
+        'pillars': args.pillars,
+        'profiles': args.profiles,
+        'ticks': args.ticks,
+        'poll_latency_ms': {'p50': round(statistics.median(poll_latencies) * 1000, 2),
+                            'p95': round(get_percentile(poll_latencies, 0.95) * 1000, 2),
+                            'max': round(max(poll_latencies) * 1000, 2)},
+        'tick_latency_ms': {'p50': round(statistics.median(tick_latencies) * 1000, 2),
+                            'p95': round(get_percentile(tick_latencies, 0.95) * 1000, 2),
+                            'max': round(max(tick_latencies) * 1000, 2)},
+        'events': r['events'],
+        'events_per_second': round(r['events'] / r['detection_time'], 2),
+        'messages': messages,
+        'messages_per_second': round(messages / r['total_time'], 2),
+        'rpc_requests': counts['rpc_requests'],
+        'rpc_calls': counts['rpc_calls'],
+        'peak_traced_memory_mb': round(peak_memory / 1024 / 1024, 2),
+        'max_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2),
+        'data_dir': r['data_dir']
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the tracker against a local simulated node, Telegram and Discord')
+    parser.add_argument('--pillars', type=int, default=1000, help='number of simulated Pillars')
+    parser.add_argument('--ticks', type=int, default=100, help='number of tracker runs')
+    parser.add_argument('--momentums-per-tick', type=int, default=6,
+                        help='momentums produced between two runs')
+    parser.add_argument('--momentums-per-epoch', type=int, default=8640)
+    parser.add_argument('--profiles', type=int, default=1,
+                        help='number of profiles that share the simulated node')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='added latency of every node request in seconds')
+    parser.add_argument('--script', help='JSON file with a list of steps to replay instead of random events')
+    parser.add_argument('--record', help='record the Pillar snapshots to this file for replay.py, one file per profile')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the tracker')
+    args = parser.parse_args()
+
+    print(f'{str(datetime.datetime.now())}: Running benchmark')
+    results = run_benchmark(args)
+    if args.json:
+        print(json.dumps(results, indent=4))
+        return
+    for key, value in results.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
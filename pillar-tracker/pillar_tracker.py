@@ -3,265 +3,265 @@ import datetime
 import sys
 import os
 import random
-
-from utils.node_rpc_wrapper import NodeRpcWrapper
+import time
+import signal
+import argparse
+import hashlib
+import asyncio
+
+from utils.http_wrapper import HttpWrapper
+from utils.node_pool import NodePool
 from utils.telegram_wrapper import TelegramWrapper
 from utils.discord_wrapper import DiscordWrapper
-
-
-def check_and_send_reward_collection_message(telegram, discord, cfg, cached_epoch, new_epoch):
-    channel_id = cfg['telegram_channel_id']
+from utils.notification_dispatcher import NotificationDispatcher
+from utils.outbox import Outbox
+from utils.state_store import StateStore
+from utils.history_store import HistoryStore
+from utils.pinned_stats_renderer import PinnedStatsRenderer
+from utils.epoch_tracker import EpochTracker
+from utils.reward_collector import RewardCollector
+from utils.subscriptions import SubscriptionManager
+from utils.ranking import RankingIndex, RANK_ENTERED, RANK_EXITED, RANK_OVERTAKE, WEIGHT_CHANGED
+from utils.momentum_detector import MissedMomentumDetector
+from utils.metrics import metrics, MetricsServer, JsonLog
+from utils.query_api import QueryApi, QueryApiServer
+from utils.pillar import Pillar, pillars_to_lists
+from utils.pillar_diff import diff_pillars, PILLAR_DISMANTLED, PILLAR_CREATED, PILLAR_NAME_CHANGED, PILLAR_REWARD_SHARE_CHANGED, PILLAR_STATS_CHANGED
+
+
+def send_notification(notifications, cfg, key, message, description):
+    # Add the message for the Telegram channel and the Discord channel if configured.
+    # The key identifies the event and is used to prevent duplicate notifications.
+    # Critical events are not combined into digests.
+    critical = key.split(':')[0] in cfg.get('notification_digest_bypass', ['dismantled', 'created'])
+    notifications.append({'key': key, 'sink': 'telegram', 'target': cfg['telegram_channel_id'],
+                          'message': message, 'description': description, 'critical': critical})
+    if len(cfg['discord_channel_webhook']) > 0:
+        notifications.append({'key': key, 'sink': 'discord', 'target': cfg['discord_channel_webhook'],
+                              'message': message, 'description': description, 'critical': critical})
+
+
+def get_api_events(notifications, cached_pillars, new_pillars):
+    # One event for every notified event. Notification keys start with the event type, followed
+    # by the owner address for Pillar events.
+    events = []
+    keys = set()
+    for n in notifications:
+        if n['key'] in keys:
+            continue
+        keys.add(n['key'])
+        parts = n['key'].split(':')
+        pillar = None
+        if len(parts) > 1:
+            pillar = new_pillars.get(parts[1]) or cached_pillars.get(parts[1])
+        events.append({'type': parts[0], 'ownerAddress': pillar.owner_address if pillar is not None else None,
+                       'name': pillar.name if pillar is not None else None, 'message': n['message']})
+    return events
+
+
+def queue_notifications(outbox, dispatcher, notifications, event_id):
+    # Make the keys unique per destination and per cached data the events were detected against.
+    # Detecting the same events again after a crash results in the same keys.
+    for n in notifications:
+        n['key'] = hashlib.sha1(
+            f'{event_id}|{n["key"]}|{n["sink"]}|{n["target"]}'.encode()).hexdigest()
+
+    # Durably store the notifications before they are sent
+    for n in outbox.append(notifications):
+        dispatcher.dispatch(n)
+
+
+def check_and_send_reward_collection_message(telegram, notifications, cfg, cached_epoch, new_epoch):
     dev_chat_id = cfg['telegram_dev_chat_id']
-    discord_webhook_url = cfg['discord_channel_webhook']
 
     if new_epoch > cached_epoch:
         m = create_reward_collection_message(new_epoch)
         if 'error' in m:
             handle_error(telegram, dev_chat_id, m['error'])
         else:
-            r = telegram.bot_send_message_to_chat(channel_id, m['message'])
-            print(
-                f'Reward collection message sent to Telegram: {r.status_code}')
-
-            if len(discord_webhook_url) > 0:
-                r = discord.webhook_send_message_to_channel(
-                    discord_webhook_url, m['message'])
-                print(
-                    f'Reward collection message sent to Discord: {r.status_code}')
+            send_notification(notifications, cfg, f'reward_collection:{new_epoch}', m['message'],
+                              'Reward collection message')
 
 
-def check_and_send_missed_momentums_message(telegram, discord, cfg, cached_pillars, new_pillars, cached_momentum_status_data, cache_file):
-    channel_id = cfg['telegram_channel_id']
+def check_and_send_missed_momentums_message(telegram, notifications, cfg, detector, new_pillars, cached_momentum_status_data, events):
     dev_chat_id = cfg['telegram_dev_chat_id']
-    discord_webhook_url = cfg['discord_channel_webhook']
 
-    new_momentum_status_data = {}
+    # Only the Pillars that have changed are checked, the status of all other Pillars is kept
+    new_momentum_status_data = dict(cached_momentum_status_data)
     inactive_pillars = []
-    for owner_address in new_pillars:
-        pillar_name = new_pillars[owner_address]['name']
-        missed_momentums_in_a_row = 0
-        is_producing = True
-
-        if owner_address in cached_pillars and owner_address in cached_momentum_status_data:
-
-            # Get the pillar's information from cache
-            missed_momentums_in_a_row = cached_momentum_status_data[owner_address]['missedMomentums']
-            is_producing = cached_momentum_status_data[owner_address]['isProducing']                
-
-            previous_produced_momentums = cached_pillars[
-                owner_address]['currentStats']['producedMomentums']
-            current_produced_momentums = new_pillars[owner_address]['currentStats']['producedMomentums']
-            previous_expected_momentums = cached_pillars[
-                owner_address]['currentStats']['expectedMomentums']
-            current_expected_momentums = new_pillars[owner_address]['currentStats']['expectedMomentums']
-
-            # Handle epoch change
-            if current_produced_momentums == 0 and previous_produced_momentums > 0:
-                if not is_producing:
-                    inactive_pillars.append(owner_address)
-
-            # Handle normal case        
-            else:
-                # Check if pillar has produced new momentums
-                if current_produced_momentums == previous_produced_momentums:
-
-                    # Check if the amount of expected momentums has changed
-                    if current_expected_momentums != previous_expected_momentums:
-                        missed_momentums_in_a_row = missed_momentums_in_a_row + 1
-                        if missed_momentums_in_a_row >= 5:
-                            inactive_pillars.append(owner_address)
-                            is_producing = False
-                    
-                    # If expected mometum amount has not changed and pillar was previously inactive, add to inactive pillars list
-                    elif not is_producing:
-                        inactive_pillars.append(owner_address)
-                
-                # If pillar has produced new momentums set missed momentum count to zero
-                else:
-                    missed_momentums_in_a_row = 0
-                    is_producing = True
-            
-        # Add pillar's new momentum status data
-        new_momentum_status_data[owner_address] = {'name': pillar_name, 'missedMomentums': missed_momentums_in_a_row, 'isProducing': is_producing}  
-    
-    l = []
+    active_pillars = []
+    for event in events:
+        owner_address = event.owner_address
+
+        if event.type == PILLAR_DISMANTLED:
+            new_momentum_status_data.pop(owner_address, None)
+
+        elif owner_address not in new_momentum_status_data:
+            new_momentum_status_data[owner_address] = detector.create_status(event.new)
+
+        elif event.type == PILLAR_NAME_CHANGED:
+            new_momentum_status_data[owner_address] = dict(
+                new_momentum_status_data[owner_address], name=event.new.name)
+
+        elif event.type == PILLAR_STATS_CHANGED:
+            status, transition = detector.update(
+                new_momentum_status_data[owner_address], event.old, event.new)
+            new_momentum_status_data[owner_address] = status
+            if transition == detector.INACTIVE:
+                inactive_pillars.append(owner_address)
+            elif transition == detector.ACTIVE:
+                active_pillars.append(owner_address)
+
+    # Add a status for Pillars that have none yet, for example on the first check
+    if len(new_momentum_status_data) != len(new_pillars):
+        for owner_address in new_pillars:
+            if owner_address not in new_momentum_status_data:
+                new_momentum_status_data[owner_address] = detector.create_status(new_pillars[owner_address])
+
+    if len(inactive_pillars) > 0:
+        print('Inactive pillars: ' + str([new_momentum_status_data[a]['name'] for a in inactive_pillars]))
+
     for address in inactive_pillars:
-        if address in new_momentum_status_data:
-            l.append(new_momentum_status_data[address]['name'])
-    if len(l) > 0:
-        print('Inactive pillars: ' + str(l))
+        m = create_pillar_inactive_message(cached_momentum_status_data[address]['name'])
+        if 'error' in m:
+            handle_error(telegram, dev_chat_id, m['error'])
+        else:
+            send_notification(notifications, cfg, f'inactive:{address}', m['message'],
+                              'Pillar inactive message')
 
-    # Save new data
-    write_to_file_as_json({'data': new_momentum_status_data, 'timestamp': str(datetime.datetime.now())}, cache_file)
+    for address in active_pillars:
+        m = create_pillar_active_message(cached_momentum_status_data[address]['name'])
+        if 'error' in m:
+            handle_error(telegram, dev_chat_id, m['error'])
+        else:
+            send_notification(notifications, cfg, f'active:{address}', m['message'],
+                              'Pillar active again message')
 
-    for address in inactive_pillars:
-        # Verify the inactive pillar was previously producing momentums until sending message
-        if address in cached_momentum_status_data and cached_momentum_status_data[address]['isProducing']:
-            m = create_pillar_inactive_message(cached_momentum_status_data[address]['name'])
-            if 'error' in m:
-                handle_error(telegram, dev_chat_id, m['error'])
-            else:
-                r = telegram.bot_send_message_to_chat(channel_id, m['message'])
-            print(
-                f'Pillar inactive message sent to Telegram: {r.status_code}')
-            if len(discord_webhook_url) > 0:
-                r = discord.webhook_send_message_to_channel(discord_webhook_url, m['message'])
-                print(
-                    f'Pillar inactive message sent to Discord: {r.status_code}')
-
-    for address in cached_momentum_status_data:
-        # Check if a previously inactive pillar is not in the inactive pillars list anymore
-        if not cached_momentum_status_data[address]['isProducing'] and address not in inactive_pillars:
-            m = create_pillar_active_message(cached_momentum_status_data[address]['name'])
-            if 'error' in m:
-                handle_error(telegram, dev_chat_id, m['error'])
-            else:
-                r = telegram.bot_send_message_to_chat(channel_id, m['message'])
-            print(
-                f'Pillar active again message sent to Telegram: {r.status_code}')
-            if len(discord_webhook_url) > 0:
-                r = discord.webhook_send_message_to_channel(discord_webhook_url, m['message'])
-                print(
-                    f'Pillar active again message sent to Discord: {r.status_code}')
-
-
-def check_and_send_pillar_events(telegram, discord, cfg, cached_pillars, new_pillars):
-    channel_id = cfg['telegram_channel_id']
+    # Return new data
+    return {'data': new_momentum_status_data, 'timestamp': str(datetime.datetime.now())}
+
+
+def check_and_send_pillar_events(telegram, notifications, cfg, events):
     dev_chat_id = cfg['telegram_dev_chat_id']
-    discord_webhook_url = cfg['discord_channel_webhook']
-
-    # Check for dismantled Pillars. Assume Pillar is dismantled if the owner address is no longer present in the new data.
-    for owner_address in cached_pillars:
-       if owner_address not in new_pillars and len(new_pillars) < len(cached_pillars) and len(new_pillars) > 0:
-           m = create_dismantled_pillar_message(
-               cached_pillars[owner_address])
-           if 'error' in m:
-               handle_error(telegram, dev_chat_id, m['error'])
-           else:
-               name = cached_pillars[owner_address]['name']
-               r = telegram.bot_send_message_to_chat(channel_id, m['message'])
-               print(
-                   f'Pillar dismantled message sent to Telegram ({name}): {r.status_code}')
-    
-               if len(discord_webhook_url) > 0:
-                   r = discord.webhook_send_message_to_channel(
-                       discord_webhook_url, m['message'])
-                   print(
-                       f'Pillar dismantled message sent to Discord ({name}): {r.status_code}')
-
-    # Check for new Pillars. Assume Pillar is new if the owner address was not present in the cached data.
-    for owner_address in new_pillars:
-        if owner_address not in cached_pillars and len(new_pillars) > len(cached_pillars):
-            m = create_new_pillar_message(
-                new_pillars[owner_address])
-            if 'error' in m:
-                handle_error(telegram, dev_chat_id, m['error'])
-            else:
-                name = new_pillars[owner_address]['name']
-
-                r = telegram.bot_send_message_to_chat(channel_id, m['message'])
-                print(
-                    f'Pillar created message sent to Telegram ({name}): {r.status_code}')
-
-                if len(discord_webhook_url) > 0:
-                    r = discord.webhook_send_message_to_channel(
-                        discord_webhook_url, m['message'])
-                    print(
-                        f'Pillar created message sent to Discord ({name}): {r.status_code}')
-
-    # Check for Pillar name changes
-    for owner_address in new_pillars:
-        if owner_address in cached_pillars:
-
-            # Get current and cached name
-            current_name = new_pillars[owner_address]['name']
-            cached_name = cached_pillars[owner_address]['name']
-
-            if current_name != cached_name:
-                m = create_pillar_name_changed_message(
-                    cached_name, current_name)
-                if 'error' in m:
-                    handle_error(telegram, dev_chat_id, m['error'])
-                else:
-                    r = telegram.bot_send_message_to_chat(
-                        channel_id, m['message'])
-                    print(
-                        f'Pillar name changed message sent to Telegram ({cached_name} -> {current_name}): {r.status_code}')
-
-                    if len(discord_webhook_url) > 0:
-                        r = discord.webhook_send_message_to_channel(
-                            discord_webhook_url, m['message'])
-                        print(
-                            f'Pillar name changed message sent to Discord ({cached_name} -> {current_name}): {r.status_code}')
-
-    # Check for changes in reward sharing
-    for owner_address in new_pillars:
-        if owner_address in cached_pillars:
-            old_momentum_percentage = cached_pillars[
-                owner_address]['giveMomentumRewardPercentage']
-            new_momentum_percentage = new_pillars[owner_address]['giveMomentumRewardPercentage']
-            old_delegate_percentage = cached_pillars[
-                owner_address]['giveDelegateRewardPercentage']
-            new_delegate_percentage = new_pillars[owner_address]['giveDelegateRewardPercentage']
-            name = new_pillars[owner_address]['name']
-            owner_address = new_pillars[owner_address]['ownerAddress']
-            changed_shares_data = {}
-
-            if old_momentum_percentage != new_momentum_percentage:
-                changed_shares_data['name'] = name
-                changed_shares_data['ownerAddress'] = owner_address
-                changed_shares_data['momentumRewards'] = {
-                    'oldMomentumPercentage': old_momentum_percentage, 'newMomentumPercentage': new_momentum_percentage}
-
-            if old_delegate_percentage != new_delegate_percentage:
-                changed_shares_data['name'] = name
-                changed_shares_data['ownerAddress'] = owner_address
-                changed_shares_data['delegateRewards'] = {
-                    'oldDelegatePercentage': old_delegate_percentage, 'newDelegatePercentage': new_delegate_percentage}
-
-            if changed_shares_data != {}:
-                if 'momentumRewards' not in changed_shares_data:
-                    changed_shares_data['momentumRewards'] = {
-                        'oldMomentumPercentage': old_momentum_percentage}
-                if 'delegateRewards' not in changed_shares_data:
-                    changed_shares_data['delegateRewards'] = {
-                        'oldDelegatePercentage': old_delegate_percentage}
-
-                m = create_reward_share_changed_message(changed_shares_data)
-                if 'error' in m:
-                    handle_error(telegram, dev_chat_id, m['error'])
-                else:
-                    name = new_pillars[owner_address]['name']
-                    r = telegram.bot_send_message_to_chat(
-                        channel_id, m['message'])
-                    print(
-                        f'Reward share changed message sent to Telegram ({name}): {r.status_code}')
-
-                    if len(discord_webhook_url) > 0:
-                        r = discord.webhook_send_message_to_channel(
-                            discord_webhook_url, m['message'])
-                        print(
-                            f'Reward share changed message sent to Discord ({name}): {r.status_code}')
+
+    for event in events:
+        owner_address = event.owner_address
+
+        # Dismantled Pillars
+        if event.type == PILLAR_DISMANTLED:
+            name = event.old.name
+            m = create_dismantled_pillar_message(event.old)
+            key = f'dismantled:{owner_address}'
+            description = f'Pillar dismantled message ({name})'
+
+        # New Pillars
+        elif event.type == PILLAR_CREATED:
+            name = event.new.name
+            m = create_new_pillar_message(event.new)
+            key = f'created:{owner_address}'
+            description = f'Pillar created message ({name})'
+
+        # Pillar name changes
+        elif event.type == PILLAR_NAME_CHANGED:
+            cached_name = event.old.name
+            current_name = event.new.name
+            m = create_pillar_name_changed_message(cached_name, current_name)
+            key = f'name_changed:{owner_address}:{current_name}'
+            description = f'Pillar name changed message ({cached_name} -> {current_name})'
+
+        # Changes in reward sharing
+        elif event.type == PILLAR_REWARD_SHARE_CHANGED:
+            name = event.new.name
+            m = create_reward_share_changed_message(
+                get_changed_shares_data(event.old, event.new))
+            key = f'reward_share_changed:{owner_address}'
+            description = f'Reward share changed message ({name})'
+
+        else:
+            continue
+
+        if 'error' in m:
+            handle_error(telegram, dev_chat_id, m['error'])
+        else:
+            send_notification(notifications, cfg, key, m['message'], description)
+
+
+def check_and_send_ranking_events(telegram, notifications, cfg, events):
+    dev_chat_id = cfg['telegram_dev_chat_id']
+
+    for event in events:
+        owner_address = event.owner_address
+        name = event.pillar.name
+
+        # Pillars that entered or left the top N
+        if event.type == RANK_ENTERED:
+            m = create_rank_entered_message(name, event.value)
+            key = f'rank_entered:{owner_address}:{event.value}'
+            description = f'Rank entered message ({name})'
+
+        elif event.type == RANK_EXITED:
+            m = create_rank_exited_message(name, event.value)
+            key = f'rank_exited:{owner_address}:{event.value}'
+            description = f'Rank exited message ({name})'
+
+        # Pillars that moved past other Pillars
+        elif event.type == RANK_OVERTAKE:
+            m = create_rank_overtake_message(name, [pillar.name for pillar in event.other], event.value)
+            key = f'rank_overtake:{owner_address}:{event.value}'
+            description = f'Rank overtake message ({name})'
+
+        # Large weight changes
+        elif event.type == WEIGHT_CHANGED:
+            m = create_weight_changed_message(event.pillar, event.value)
+            key = f'weight_changed:{owner_address}'
+            description = f'Weight changed message ({name})'
+
+        else:
+            continue
+
+        if 'error' in m:
+            handle_error(telegram, dev_chat_id, m['error'])
+        else:
+            send_notification(notifications, cfg, key, m['message'], description)
+
+
+def get_changed_shares_data(cached_pillar, new_pillar):
+    old_momentum_percentage = cached_pillar.give_momentum_reward_percentage
+    new_momentum_percentage = new_pillar.give_momentum_reward_percentage
+    old_delegate_percentage = cached_pillar.give_delegate_reward_percentage
+    new_delegate_percentage = new_pillar.give_delegate_reward_percentage
+
+    changed_shares_data = {'name': new_pillar.name, 'ownerAddress': new_pillar.owner_address,
+                           'momentumRewards': {'oldMomentumPercentage': old_momentum_percentage},
+                           'delegateRewards': {'oldDelegatePercentage': old_delegate_percentage}}
+
+    if old_momentum_percentage != new_momentum_percentage:
+        changed_shares_data['momentumRewards']['newMomentumPercentage'] = new_momentum_percentage
+
+    if old_delegate_percentage != new_delegate_percentage:
+        changed_shares_data['delegateRewards']['newDelegatePercentage'] = new_delegate_percentage
+
+    return changed_shares_data
 
 
 def create_dismantled_pillar_message(pillar_data):
     try:
-        m = pillar_data['name'] + ' has been dismantled.'
+        m = pillar_data.name + ' has been dismantled.'
         return {'message': m}
-    except KeyError:
+    except (KeyError, AttributeError):
         return {'error': 'KeyError: create_dismantled_pillar_message'}
 
 
 def create_new_pillar_message(pillar_data):
     try:
         m = 'New pillar spawned!\n'
-        m = m + 'Say hello to ' + pillar_data['name'] + '\n'
+        m = m + 'Say hello to ' + pillar_data.name + '\n'
         m = m + 'Momentum rewards sharing: ' + \
-            str(pillar_data['giveMomentumRewardPercentage']) + '%\n'
+            str(pillar_data.give_momentum_reward_percentage) + '%\n'
         m = m + 'Delegate rewards sharing: ' + \
-            str(pillar_data['giveDelegateRewardPercentage']) + '%\n'
+            str(pillar_data.give_delegate_reward_percentage) + '%\n'
         return {'message': m}
-    except KeyError:
+    except (KeyError, AttributeError):
         return {'error': 'KeyError: create_new_pillar_message'}
 
 
@@ -303,31 +303,51 @@ def create_reward_share_changed_message(changed_shares_data):
         return {'error': 'KeyError: create_reward_share_changed_message'}
 
 
-def create_pinned_stats_message(pillars, momentum_height):
+def create_rank_entered_message(pillar_name, threshold):
     try:
-        # Only show top 70 Pillars because of Telegram's message character limit (4096 characters)
-        if len(pillars) > 70:
-            m = 'Pillar reward sharing rates (top 70)\n'
+        m = pillar_name + ' has entered the top ' + str(threshold) + '! \U0001F4C8'
+        return {'message': m}
+    except TypeError:
+        return {'error': 'KeyError: create_rank_entered_message'}
+
+
+def create_rank_exited_message(pillar_name, threshold):
+    try:
+        m = pillar_name + ' has dropped out of the top ' + str(threshold) + '. \U0001F4C9'
+        return {'message': m}
+    except TypeError:
+        return {'error': 'KeyError: create_rank_exited_message'}
+
+
+def create_rank_overtake_message(pillar_name, other_pillar_names, rank):
+    try:
+        if len(other_pillar_names) > 1:
+            other_pillar_names = ', '.join(other_pillar_names[:-1]) + ' and ' + other_pillar_names[-1]
         else:
-            m = 'Pillar reward sharing rates\n'
-        m = m + 'Last updated: ' + \
-            str(datetime.datetime.now(datetime.timezone.utc).strftime(
-                '%Y-%m-%d %H:%M:%S')) + ' (UTC)\n'
-        m = m + 'Momentum height: ' + str(momentum_height) + '\n'
-        m = m + 'M = momentum reward sharing %\n'
-        m = m + 'D = delegate reward sharing %\n'
-        m = m + 'W = pillar weight (ZNN) \n'
-        m = m + 'P/E = produced/expected momentums\n\n'
-
-        for owner_address in pillars:
-            if pillars[owner_address]['rank'] < 70:
-                weight = int(
-                    round(pillars[owner_address]['weight'] / 100000000))
-                m = m + str(pillars[owner_address]['rank'] + 1) + ' - ' + str(pillars[owner_address]['name']) + ' -> M: ' + str(pillars[owner_address]['giveMomentumRewardPercentage']) + '% D: ' + str(pillars[owner_address]['giveDelegateRewardPercentage']
-                                                                                                                                                                                                        ) + '% W: ' + str(weight) + ' P/E: ' + str(pillars[owner_address]['currentStats']['producedMomentums']) + '/' + str(pillars[owner_address]['currentStats']['expectedMomentums']) + '\n'
+            other_pillar_names = other_pillar_names[0]
+        m = pillar_name + ' has overtaken ' + other_pillar_names + ' and is now at rank ' + str(rank + 1)
         return {'message': m}
+    except TypeError:
+        return {'error': 'KeyError: create_rank_overtake_message'}
 
-    except KeyError:
+
+def create_weight_changed_message(pillar_data, change):
+    try:
+        m = 'Pillar weight changed!\n'
+        m = m + 'Pillar: ' + pillar_data.name + '\n'
+        m = m + 'Weight: ' + str(int(round(pillar_data.weight / 100000000))) + ' ZNN (' + \
+            ('+' if change > 0 else '') + str(change) + '%)'
+        return {'message': m}
+    except (TypeError, AttributeError):
+        return {'error': 'KeyError: create_weight_changed_message'}
+
+
+def create_pinned_stats_message(renderer, pillars, momentum_height, aprs=None, ranking=None):
+    try:
+        # Show as many Pillars as fit in Telegram's message character limit (4096 characters)
+        return renderer.render(pillars, momentum_height, aprs, ranking)
+
+    except (KeyError, AttributeError):
         return {'error': 'KeyError: create_pinned_stats_message'}
 
 
@@ -368,149 +388,685 @@ def read_file(file_path):
     return content
 
 
-def write_to_file_as_json(data, file_name):
-    with open(file_name, 'w') as outfile:
-        json.dump(data, outfile, indent=4)
+def handle_error(telegram, dev_chat_id, message):
+    send_dev_message(telegram, dev_chat_id, message)
 
+    # Exit script on error
+    sys.exit()
 
-def handle_error(telegram, dev_chat_id, message):
+
+def send_dev_message(telegram, dev_chat_id, message):
     print(message)
 
     # Send the developer a message if a developer chat ID is configured
     if len(dev_chat_id) != 0:
         telegram.bot_send_message_to_chat(chat_id=dev_chat_id, message=message)
 
-    # Exit script on error
-    sys.exit()
-
 
-def main():
+def hold_back_unconfirmed_pillars(cached_pillars, pillar_data):
+    # Pillars that the node quorum has not confirmed keep their cached momentum stats, and Pillars
+    # that are missing keep their cached data. Dismantled and inactive Pillars are detected once
+    # the nodes agree, all other changes are used right away.
+    pillars = dict(pillar_data['pillars'])
+    for owner_address, cached in cached_pillars.items():
+        if pillar_data['confirmed'] and owner_address not in pillar_data['disputed']:
+            continue
+        pillar = pillars.get(owner_address)
+        if pillar is None:
+            pillars[owner_address] = cached
+        elif (pillar.produced_momentums, pillar.expected_momentums) != (cached.produced_momentums, cached.expected_momentums):
+            pillars[owner_address] = Pillar(pillar.owner_address, pillar.name, pillar.weight,
+                                            cached.produced_momentums, cached.expected_momentums,
+                                            pillar.give_momentum_reward_percentage,
+                                            pillar.give_delegate_reward_percentage, pillar.rank)
+    return dict(pillar_data, pillars=pillars)
+
+
+def check_quorum(tracker, pillar_data):
+    # Report to the developer once the nodes have disagreed for node_quorum_alert_runs runs in a row
+    cfg = tracker['cfg']
+    disputed = len(pillar_data['disputed']) if pillar_data['confirmed'] else len(pillar_data['pillars'])
+    metrics.set('quorum_disputed_pillars', disputed, {'profile': tracker['name']})
+    if not pillar_data['confirmed']:
+        metrics.inc('quorum_unconfirmed_runs_total', {'profile': tracker['name']})
+
+    runs = tracker['store'].get_value('quorum_disputed_runs', 0)
+    new_runs = runs + 1 if disputed > 0 else 0
+    if new_runs != runs:
+        tracker['store'].set_value('quorum_disputed_runs', new_runs)
+    if new_runs == cfg.get('node_quorum_alert_runs', 10):
+        send_dev_message(tracker['telegram'], cfg['telegram_dev_chat_id'],
+                         f'Node quorum: the nodes have disagreed on {disputed} Pillars for {new_runs} runs.')
+
+
+def get_data_store_files(path, profile_name=''):
+    # Every profile has its own data store directory
+    data_store_dir = f'{path}/data_store'
+    if len(profile_name) > 0:
+        data_store_dir = f'{data_store_dir}/{profile_name}'
+    return {
+        'dir': data_store_dir,
+        'state': f'{data_store_dir}/state.db',
+        'outbox': f'{data_store_dir}/outbox.jsonl',
+        'history': f'{data_store_dir}/history',
+
+        # Cache files used before the state store, imported on first start
+        'pillar': f'{data_store_dir}/pillar_data.json',
+        'epoch': f'{data_store_dir}/epoch_data.json',
+        'momentum_status': f'{data_store_dir}/momentum_status_data.json',
+        'node_status': f'{data_store_dir}/node_status_data.json'
+    }
+
+
+def get_snapshot_record_file(cfg):
+    # Every profile records its own snapshots, the profile name is added before the extension
+    if len(cfg.get('name', '')) == 0:
+        return cfg['snapshot_record_file']
+    root, extension = os.path.splitext(cfg['snapshot_record_file'])
+    return f'{root}.{cfg["name"]}{extension}'
+
+
+def record_snapshot(file_path, height, momentum_timestamp, pillars):
+    # One JSON line per snapshot, read by replay.py
+    with open(file_path, 'a') as f:
+        f.write(json.dumps({'height': height, 'timestamp': momentum_timestamp,
+                            'pillars': pillars_to_lists(pillars)},
+                           separators=(',', ':')) + '\n')
+
+
+def init_data_store(files):
 
-    # Get current file path
-    path = os.path.dirname(os.path.abspath(__file__))
+    # Check and create data store directory
+    if not os.path.exists(files['dir']):
+        os.makedirs(files['dir'], exist_ok=True)
 
-    # Read config
-    cfg = read_file(f'{path}/config/config.json')
 
-    # Data store directory
-    DATA_STORE_DIR = f'{path}/data_store'
+def load_state(store):
+    with metrics.time('state_load_duration_seconds'):
+        return store.load()
 
-    # Pillar cache file
-    PILLAR_CACHE_FILE = f'{DATA_STORE_DIR}/pillar_data.json'
 
-    # Epoch cache file
-    EPOCH_CACHE_FILE = f'{DATA_STORE_DIR}/epoch_data.json'
+def save_state(state, store):
+    with metrics.time('state_save_duration_seconds'):
+        store.save(state)
 
-    # Momentum status cache file
-    MOMENTUM_STATUS_CACHE_FILE = f'{DATA_STORE_DIR}/momentum_status_data.json'
 
-    # Node status file
-    NODE_STATUS_FILE = f'{DATA_STORE_DIR}/node_status_data.json'
+def check_node_status(telegram, cfg, state, latest_momentum, daemon=False):
+    node_status = state['node_status']
+    height = latest_momentum['height']
 
-    # Check and create data store directory
-    if not os.path.exists(DATA_STORE_DIR):
-        os.makedirs(DATA_STORE_DIR, exist_ok=True)
+    if daemon:
+        now = time.monotonic()
 
-    # Check and create pillar cache file
-    if not os.path.exists(PILLAR_CACHE_FILE):
-        open(PILLAR_CACHE_FILE, 'w+').close()
+        # A new momentum has been produced. Also recover from a previously reported stuck node.
+        if height > node_status['height']:
+            state['node_status'] = {'height': height, 'error': False}
+            state['last_height_change'] = now
+            return True
 
-    # Check and create epoch cache file
-    if not os.path.exists(EPOCH_CACHE_FILE):
-        open(EPOCH_CACHE_FILE, 'w+').close()
+        # No new momentum since the previous tick. Only report the node as stuck once it has
+        # not advanced for longer than the configured timeout.
+        if 'last_height_change' not in state:
+            state['last_height_change'] = now
+        stuck_timeout = cfg.get('node_stuck_timeout', 300)
+        if now - state['last_height_change'] >= stuck_timeout and not node_status['error']:
+            state['node_status'] = {'height': height, 'error': True}
+            handle_error(
+                telegram, cfg['telegram_dev_chat_id'], 'Node is stuck. Running prevented.')
+        return False
 
-    # Check and create momentum status cache file
-    if not os.path.exists(MOMENTUM_STATUS_CACHE_FILE):
-        open(MOMENTUM_STATUS_CACHE_FILE, 'w+').close()
+    if height > node_status['height'] and not node_status['error']:
+        state['node_status'] = {'height': height, 'error': False}
+        return True
+    else:
+        state['node_status'] = {'height': height, 'error': True}
+        handle_error(
+            telegram, cfg['telegram_dev_chat_id'], 'Node is stuck. Running prevented.')
 
-    # Check and create node status file
-    if not os.path.exists(NODE_STATUS_FILE):
-        write_to_file_as_json({'height': 0, 'error': False}, NODE_STATUS_FILE)
 
-    # Create wrappers
-    node = NodeRpcWrapper(node_url=cfg['node_url_http'])
-    telegram = TelegramWrapper(
-        bot_api_key=cfg['telegram_bot_api_key'])
-    discord = DiscordWrapper()
+def get_profiles(cfg):
+    # Each profile overrides the top-level values of the config. Without profiles the config is a single profile.
+    if 'profiles' not in cfg:
+        return [dict(cfg, name=cfg.get('name', ''))]
+    base_cfg = {key: value for key, value in cfg.items() if key != 'profiles'}
+    return [dict(base_cfg, **profile) for profile in cfg['profiles']]
+
+
+def get_tracker_groups(trackers):
+    # Profiles that use the same nodes are checked together
+    groups = {}
+    for tracker in trackers:
+        groups.setdefault(id(tracker['node']), []).append(tracker)
+    return list(groups.values())
+
+
+def get_reference_reward_addresses(cfg):
+    return cfg.get('reference_reward_addresses') or [cfg['reference_reward_address']]
+
+
+def get_poll_data(trackers, states):
+    # Get latest momentum and Pillar data of all profiles in a group in one batch
+    with metrics.time('poll_duration_seconds'):
+        r = trackers[0]['node'].get_poll_data([])
+    latest_momentum = r['latest_momentum']
+
+    # Only query the reward epochs of the profiles that expect a new epoch
+    reward_addresses = []
+    if 'error' not in latest_momentum:
+        for tracker in trackers:
+            if tracker['epoch_tracker'].needs_check(states[tracker['name']]['epoch_data'], latest_momentum['momentumTimestamp']):
+                for address in get_reference_reward_addresses(tracker['cfg']):
+                    if address not in reward_addresses:
+                        reward_addresses.append(address)
+    reward_epochs = {}
+    if len(reward_addresses) > 0:
+        with metrics.time('reward_epoch_duration_seconds'):
+            reward_epochs = trackers[0]['node'].get_reward_epochs(reward_addresses)
+
+    poll_data = []
+    for tracker in trackers:
+        epoch_data = states[tracker['name']]['epoch_data']
+        responses = [reward_epochs[address] for address in get_reference_reward_addresses(tracker['cfg'])
+                     if address in reward_epochs]
+        if len(responses) > 0:
+            epoch_data = tracker['epoch_tracker'].resolve(
+                epoch_data, responses, latest_momentum['momentumTimestamp'])
+        poll_data.append({'latest_momentum': latest_momentum,
+                          'pillar_data': dict(r['pillar_data']),
+                          'epoch_data': epoch_data})
+    return poll_data
+
+
+def run_trackers(trackers, states):
+    for tracker, poll_data in zip(trackers, get_poll_data(trackers, states)):
+        start = time.perf_counter()
+        try:
+            run_tracker(tracker, states[tracker['name']], poll_data)
+        except SystemExit:
+            # handle_error exits on error. Continue with the other profiles.
+            pass
+        log_run(tracker, states[tracker['name']], time.perf_counter() - start)
+
+
+def log_run(tracker, state, duration):
+    metrics.observe('run_duration_seconds', duration, {'profile': tracker['name']})
+
+    # Write the metrics after every run if a JSON log is configured
+    if tracker['log'] is not None:
+        tracker['log'].write('run', profile=tracker['name'], height=state['node_status']['height'],
+                             duration=round(duration, 6), metrics=metrics.to_dict())
+
+
+def run_tracker(tracker, state, poll_data, daemon=False):
+    cfg = tracker['cfg']
+    telegram = tracker['telegram']
+    dispatcher = tracker['dispatcher']
 
     # Get latest momentum
-    latest_momentum = node.get_latest_momentum()
+    latest_momentum = poll_data['latest_momentum']
     if 'error' in latest_momentum:
         handle_error(
             telegram, cfg['telegram_dev_chat_id'], latest_momentum['error'])
 
-    node_status = read_file(NODE_STATUS_FILE)
+    # A Pillar list that does not add up to the count reported by the node would show the
+    # missing Pillars as dismantled. Keep the cached data and check again on the next run.
+    if poll_data['pillar_data'].get('complete') is False:
+        print(f'{str(datetime.datetime.now())}: Incomplete Pillar data. Skipping.')
+        return
 
-    # Check node status
-    if latest_momentum['height'] > node_status['height'] and not node_status['error']:
-        write_to_file_as_json({'height': latest_momentum['height'], 'error': False}, NODE_STATUS_FILE)
-    else:
-        write_to_file_as_json({'height': latest_momentum['height'], 'error': True}, NODE_STATUS_FILE)
-        handle_error(
-            telegram, cfg['telegram_dev_chat_id'], 'Node is stuck. Running prevented.')
+    if 'error' not in latest_momentum:
+        metrics.set('momentum_height', latest_momentum['height'], {'profile': tracker['name']})
+
+    # Handle the watchlist commands sent to the bot
+    if tracker['subscriptions'] is not None:
+        tracker['subscriptions'].process_commands(poll_data['pillar_data'].get('pillars', {}))
+
+    # Check node status. Nothing has changed if there is no new momentum.
+    if not check_node_status(telegram, cfg, state, latest_momentum, daemon):
+        return
 
     # Get latest Pillar data
-    new_pillar_data = node.get_all_pillars()
+    new_pillar_data = poll_data['pillar_data']
     if 'error' in new_pillar_data:
         handle_error(
             telegram, cfg['telegram_dev_chat_id'], new_pillar_data['error'])
 
+    # With a node quorum, do not detect dismantled or inactive Pillars from data that the other
+    # nodes disagree with
+    if 'confirmed' in new_pillar_data:
+        check_quorum(tracker, new_pillar_data)
+        if state['pillar_data'] is not None:
+            new_pillar_data = hold_back_unconfirmed_pillars(state['pillar_data']['pillars'], new_pillar_data)
+
     # Get reward epoch
-    new_epoch_data = node.get_reward_epoch(cfg['reference_reward_address'])
+    new_epoch_data = poll_data['epoch_data']
     if 'error' in new_epoch_data:
         handle_error(
             telegram, cfg['telegram_dev_chat_id'], new_epoch_data['error'])
 
-    # Get cached Pillar data from file
-    if os.stat(PILLAR_CACHE_FILE).st_size != 0:
-        cached_pillar_data = read_file(PILLAR_CACHE_FILE)
-    else:
-        cached_pillar_data = None
-
-    # Get cached epoch data from file
-    if os.stat(EPOCH_CACHE_FILE).st_size != 0:
-        cached_epoch_data = read_file(EPOCH_CACHE_FILE)
-    else:
-        cached_epoch_data = None
-
-    # Get cached momentum status data from file
-    if os.stat(MOMENTUM_STATUS_CACHE_FILE).st_size != 0:
-        cached_momentum_status_data = read_file(MOMENTUM_STATUS_CACHE_FILE)
+    # Collect the rewards of every Pillar once the rewards of a new epoch are available
+    aprs = None
+    if tracker['reward_collector'] is not None:
+        with metrics.time('reward_collection_duration_seconds'):
+            tracker['reward_collector'].collect(new_pillar_data['pillars'], new_epoch_data['epoch'])
+        aprs = tracker['reward_collector'].get_aprs(new_pillar_data['pillars'])
+
+    cached_pillar_data = state['pillar_data']
+    cached_epoch_data = state['epoch_data']
+    if state['momentum_status_data'] is not None:
+        cached_momentum_status_data = state['momentum_status_data']
     else:
         cached_momentum_status_data = {'data': {}}
+    new_momentum_status_data = state['momentum_status_data']
 
-    # Cache current Pillar data to file
-    write_to_file_as_json(new_pillar_data, PILLAR_CACHE_FILE)
-
-    # Cache current epoch data to file
-    write_to_file_as_json(new_epoch_data, EPOCH_CACHE_FILE)
+    # Move the Pillars whose weight has changed in the ranking index. A new index is built from the
+    # cached data first, so that the ranking changes are also detected on the first run.
+    ranking = tracker['ranking']
+    if ranking.is_empty() and cached_pillar_data is not None:
+        ranking.update(cached_pillar_data['pillars'])
+    with metrics.time('ranking_duration_seconds'):
+        ranking_events = ranking.update(new_pillar_data['pillars'])
 
     # Create and update the pinned stats message
     pinned_stats_message = create_pinned_stats_message(
-        new_pillar_data['pillars'], latest_momentum['height'])
+        tracker['pinned_stats_renderer'], new_pillar_data['pillars'], latest_momentum['height'], aprs, ranking)
     if 'error' in pinned_stats_message:
         handle_error(telegram, cfg['telegram_dev_chat_id'],
                      pinned_stats_message['error'])
     else:
-        r = telegram.bot_edit_message(
-            chat_id=cfg['telegram_channel_id'], message_id=cfg['telegram_pinned_message_id'], message=pinned_stats_message['message'])
-        print(f'Pinned message updated on Telegram: {r.status_code}')
+        # Skip the update if no row has changed and update at most every pinned_message_min_edit_interval seconds.
+        # The update is only recorded once it has been delivered, an edit that failed is sent again on the next run.
+        body_hash = hashlib.sha1(
+            pinned_stats_message['body'].encode()).hexdigest()
+        last_update = state['pinned_stats']
+        if state.get('pinned_stats_pending') != body_hash and (
+                last_update is None or (last_update['hash'] != body_hash and
+                                        time.time() - last_update['timestamp'] >= cfg.get('pinned_message_min_edit_interval', 60))):
+            def on_delivered():
+                state['pinned_stats'] = {'hash': body_hash, 'timestamp': time.time()}
+            dispatcher.edit_telegram(
+                chat_id=cfg['telegram_channel_id'], message_id=cfg['telegram_pinned_message_id'], message=pinned_stats_message['message'], description='Pinned message update',
+                on_delivered=on_delivered)
+            state['pinned_stats_pending'] = body_hash
+
+    notifications = []
+
+    detection_start = time.perf_counter()
+
+    # Compare the cached and new Pillar data once for all checks
+    if cached_pillar_data is not None:
+        with metrics.time('pillar_diff_duration_seconds'):
+            events = diff_pillars(
+                cached_pillar_data['pillars'], new_pillar_data['pillars'])
+        for event in events:
+            metrics.inc('pillar_events_total', {'profile': tracker['name'], 'type': event.type})
 
     # Check for new Pillar events if cached data exists
     if cached_pillar_data is not None:
         check_and_send_pillar_events(
-            telegram, discord, cfg, cached_pillar_data['pillars'], new_pillar_data['pillars'])
+            telegram, notifications, cfg, events)
+
+    # Check for rank and weight changes
+    if cached_pillar_data is not None:
+        check_and_send_ranking_events(
+            telegram, notifications, cfg, ranking_events)
 
     # Check if new rewards are available
     if cached_epoch_data is not None:
         check_and_send_reward_collection_message(
-            telegram, discord, cfg, cached_epoch_data['epoch'], new_epoch_data['epoch'])
+            telegram, notifications, cfg, cached_epoch_data['epoch'], new_epoch_data['epoch'])
 
     # Check for missed momentums
     # TODO: Fix so that momentum status cache is stored on first run as well
     if cached_pillar_data is not None:
-        check_and_send_missed_momentums_message(
-                telegram, discord, cfg, cached_pillar_data['pillars'], new_pillar_data['pillars'], cached_momentum_status_data['data'], MOMENTUM_STATUS_CACHE_FILE)
+        new_momentum_status_data = check_and_send_missed_momentums_message(
+                telegram, notifications, cfg, tracker['missed_momentum_detector'], new_pillar_data['pillars'], cached_momentum_status_data['data'], events)
+
+    # The query API shows the notified events
+    api_events = []
+    if tracker['api'] is not None and cached_pillar_data is not None:
+        api_events = get_api_events(notifications, cached_pillar_data['pillars'], new_pillar_data['pillars'])
+
+    # Send the events of watched Pillars to their subscribers as well
+    if tracker['subscriptions'] is not None:
+        notifications = notifications + tracker['subscriptions'].fan_out(notifications)
+
+    # Queue the notifications before the cached data is advanced. If the run is stopped before
+    # this point the same events are detected again on the next run.
+    if cached_pillar_data is not None:
+        event_id = cached_pillar_data['timestamp']
+    else:
+        event_id = ''
+
+    # The daemon only writes the state on the checkpoint schedule. Write the cached data the events
+    # were detected against before queueing them, so that after a crash the same events are detected
+    # against the same cached data again and get the same keys.
+    if daemon and len(notifications) > 0:
+        save_state(state, tracker['store'])
+
+    metrics.observe('detection_duration_seconds', time.perf_counter() - detection_start)
+    metrics.inc('notifications_queued_total', {'profile': tracker['name']}, len(notifications))
+    queue_notifications(tracker['outbox'], dispatcher, notifications, event_id)
+
+    # Cache current data
+    state['pillar_data'] = new_pillar_data
+    state['epoch_data'] = new_epoch_data
+    state['momentum_status_data'] = new_momentum_status_data
+
+    # Record the snapshots for offline replays
+    if len(cfg.get('snapshot_record_file', '')) > 0:
+        record_snapshot(get_snapshot_record_file(cfg), latest_momentum['height'],
+                        latest_momentum['momentumTimestamp'], new_pillar_data['pillars'])
+
+    # Keep the Pillar stats history
+    tracker['history'].append(
+        latest_momentum['height'], new_pillar_data['pillars'])
+    tracker['history'].run_maintenance()
+
+    # Refresh the responses of the query API
+    if tracker['api'] is not None:
+        tracker['api'].update(tracker['name'], latest_momentum['height'], new_pillar_data['pillars'],
+                              new_momentum_status_data['data'] if new_momentum_status_data is not None else None,
+                              api_events)
+
+
+def run_daemon_tick(trackers, states):
+    for tracker, poll_data in zip(trackers, get_poll_data(trackers, states)):
+        state = states[tracker['name']]
+        start = time.perf_counter()
+        try:
+            run_tracker(tracker, state, poll_data, daemon=True)
+        except SystemExit:
+            # handle_error exits the script on error. Keep the daemon running and retry on the next tick.
+            pass
+        except Exception as e:
+            print(f'{str(datetime.datetime.now())}: Tick failed: {repr(e)}')
+            metrics.inc('tick_failures_total', {'profile': tracker['name']})
+        log_run(tracker, state, time.perf_counter() - start)
+
+        # Only write the state to disk on the checkpoint schedule
+        checkpoint_interval = tracker['cfg'].get('daemon_checkpoint_interval', 300)
+        if time.monotonic() - state['last_checkpoint'] >= checkpoint_interval:
+            save_state(state, tracker['store'])
+            state['last_checkpoint'] = time.monotonic()
+
+
+def run_poll_loop(groups, states):
+    poll_interval = groups[0][0]['cfg'].get('daemon_poll_interval', 10)
+    while True:
+        tick_start = time.monotonic()
+        for trackers in groups:
+            run_daemon_tick(trackers, states)
+        time.sleep(max(0, poll_interval - (time.monotonic() - tick_start)))
+
+
+async def run_momentum_subscription(trackers, states):
+    # Only required for momentum subscriptions
+    from utils.node_ws_wrapper import NodeWsWrapper
+
+    cfg = trackers[0]['cfg']
+    loop = asyncio.get_running_loop()
+    new_momentum = asyncio.Event()
+
+    async def on_momentum(momentum=None):
+        new_momentum.set()
+
+    async def run_checks():
+        # Momentums that arrive while a tick is running are handled by a single follow-up tick.
+        # Poll anyway if no momentum has been received for a while, so that a stuck node or a
+        # broken subscription is still detected.
+        if len(cfg.get('node_url_ws', '')) > 0:
+            fallback_poll_interval = cfg.get('ws_fallback_poll_interval', 60)
+        else:
+            fallback_poll_interval = cfg.get('daemon_poll_interval', 10)
+        while True:
+            try:
+                await asyncio.wait_for(new_momentum.wait(), timeout=fallback_poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            new_momentum.clear()
+            await loop.run_in_executor(None, run_daemon_tick, trackers, states)
+
+    # Groups without a WebSocket endpoint are polled
+    if len(cfg.get('node_url_ws', '')) == 0:
+        await run_checks()
+        return
+
+    ws = NodeWsWrapper(node_url=cfg['node_url_ws'])
+    await asyncio.gather(
+        ws.subscribe_to_momentums(on_momentum, on_subscribed=on_momentum), run_checks())
+
+
+async def run_momentum_subscriptions(groups, states):
+    await asyncio.gather(*[run_momentum_subscription(trackers, states) for trackers in groups])
+
+
+def run_daemon(trackers):
+
+    # Stop gracefully on SIGTERM so that the final checkpoint is written
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    states = {}
+    for tracker in trackers:
+        states[tracker['name']] = load_state(tracker['store'])
+        states[tracker['name']]['last_checkpoint'] = time.monotonic()
+
+    # Serve the metrics for scraping while the daemon is running
+    cfg = trackers[0]['cfg']
+    if cfg.get('metrics_port', 0) > 0:
+        MetricsServer(metrics, host=cfg.get('metrics_host', '127.0.0.1'), port=cfg['metrics_port']).start()
+
+    # Serve the query API from the cached data until the first new snapshot
+    api = trackers[0]['api']
+    if api is not None:
+        for tracker in trackers:
+            state = states[tracker['name']]
+            if state['pillar_data'] is not None:
+                api.update(tracker['name'], state['node_status']['height'], state['pillar_data']['pillars'],
+                           state['momentum_status_data']['data'] if state['momentum_status_data'] is not None else None, [])
+        QueryApiServer(api, host=cfg.get('api_host', '127.0.0.1'), port=cfg['api_port']).start()
+
+    groups = get_tracker_groups(trackers)
+    try:
+        # Run the checks on every new momentum if a WebSocket endpoint is configured, otherwise poll
+        if any(len(trackers[0]['cfg'].get('node_url_ws', '')) > 0 for trackers in groups):
+            asyncio.run(run_momentum_subscriptions(groups, states))
+        else:
+            run_poll_loop(groups, states)
+    except KeyboardInterrupt:
+        print(f'{str(datetime.datetime.now())}: Stopping')
+    finally:
+        for tracker in trackers:
+            save_state(states[tracker['name']], tracker['store'])
+
+
+def create_http(cfg):
+    return HttpWrapper(
+        connect_timeout=cfg.get('http_connect_timeout', 5),
+        read_timeout=cfg.get('http_read_timeout', 30),
+        max_retries=cfg.get('http_max_retries', 2),
+        backoff_factor=cfg.get('http_backoff_factor', 0.5))
+
+
+def create_node(cfg, http):
+    # Calls are routed to the freshest node of the configured nodes
+    return NodePool(get_node_urls(cfg), http=http,
+                    probe_interval=cfg.get('node_probe_interval', 30),
+                    max_height_lag=cfg.get('node_max_height_lag', 2),
+                    quorum=cfg.get('node_quorum', 1),
+                    quorum_height_tolerance=cfg.get('node_quorum_height_tolerance', 2),
+                    page_size=cfg.get('node_page_size', 1000),
+                    page_workers=cfg.get('node_page_workers', 4))
+
+
+def get_node_urls(cfg):
+    return cfg.get('node_urls_http') or [cfg['node_url_http']]
+
+
+def create_trackers(cfg, path, daemon=False):
+    # All profiles share one pooled HTTP client. Profiles that use the same nodes share the node pool.
+    http = create_http(cfg)
+    log = create_log(cfg)
+    nodes = {}
+
+    # The query API is only served by the daemon
+    api = None
+    if daemon and cfg.get('api_port', 0) > 0:
+        api = QueryApi(max_events=cfg.get('api_max_events', 100))
+    trackers = []
+    for profile_cfg in get_profiles(cfg):
+        node_key = tuple(get_node_urls(profile_cfg))
+        if node_key not in nodes:
+            nodes[node_key] = create_node(profile_cfg, http)
+
+        files = get_data_store_files(path, profile_cfg['name'])
+        init_data_store(files)
+        trackers.append(create_tracker(profile_cfg, files, daemon,
+                                       http=http, node=nodes[node_key], log=log, api=api))
+    return trackers
+
+
+def create_log(cfg):
+    # Structured log of every run
+    if len(cfg.get('metrics_log_file', '')) > 0:
+        return JsonLog(cfg['metrics_log_file'])
+    return None
+
+
+def create_missed_momentum_detector(cfg):
+    # Inactive Pillars are detected from the missed momentums in a window of expected momentums
+    return MissedMomentumDetector(
+        window=cfg.get('missed_momentum_window', 10),
+        inactive_threshold=cfg.get('missed_momentum_threshold', 5),
+        active_threshold=cfg.get('produced_momentum_threshold', 1))
+
+
+def create_tracker(cfg, files, daemon=False, http=None, node=None, log=None, api=None):
+
+    # Create wrappers. All wrappers share one pooled HTTP client.
+    if http is None:
+        http = create_http(cfg)
+    if node is None:
+        node = create_node(cfg, http)
+    telegram = TelegramWrapper(
+        bot_api_key=cfg['telegram_bot_api_key'], http=http,
+        api_base_url=cfg.get('telegram_api_base_url', TelegramWrapper.API_BASE_URL))
+    discord = DiscordWrapper(http=http)
+
+    # Cached data is kept in the state store. Import the former cache files on first start.
+    store = StateStore(files['state'])
+    if store.is_empty():
+        store.import_json_files(files)
+
+    # Reward epochs are predicted from the momentum timestamps
+    epoch_tracker = EpochTracker(store,
+                                 genesis_timestamp=cfg.get('epoch_genesis_timestamp', 1637755200),
+                                 epoch_length=cfg.get('epoch_length', 86400),
+                                 check_window=cfg.get('reward_check_window', 3600),
+                                 confirmations=cfg.get('reward_epoch_confirmations', 1),
+                                 late_check_interval=cfg.get('reward_late_check_interval', 300),
+                                 max_late_check_interval=cfg.get('reward_max_late_check_interval', 3600))
+
+    missed_momentum_detector = create_missed_momentum_detector(cfg)
+
+    # The reward history of every Pillar is collected for the APR in the pinned stats message
+    reward_collector = None
+    if cfg.get('reward_collector_enabled', False):
+        reward_collector = RewardCollector(
+            node, store,
+            max_workers=cfg.get('reward_collector_workers', 4),
+            requests_per_second=cfg.get('reward_collector_requests_per_second', 5),
+            batch_size=cfg.get('reward_collector_batch_size', 25),
+            history_epochs=cfg.get('reward_history_epochs', 30),
+            apr_epochs=cfg.get('reward_apr_epochs', 7),
+            epoch_length=cfg.get('epoch_length', 86400))
+
+    # Pillars sorted by weight for rank events and the pinned stats message
+    ranking = RankingIndex(rank_thresholds=cfg.get('rank_thresholds', []),
+                           weight_change_threshold=cfg.get('weight_change_threshold', 0),
+                           overtake_top=cfg.get('rank_overtake_top', 0))
+
+    # Rendered rows of the pinned stats message are kept between runs of the daemon
+    pinned_stats_renderer = PinnedStatsRenderer()
+
+    # Pillar stats are stored by momentum height for reports
+    history = HistoryStore(files['history'],
+                           retention_days=cfg.get('history_retention_days', 365),
+                           downsample_after_days=cfg.get('history_downsample_after_days', 30),
+                           downsample_interval=cfg.get('history_downsample_interval', 360))
+
+    # Detected events are stored in the outbox until they have been delivered
+    outbox = Outbox(files['outbox'])
+
+    # Notifications are delivered in the background so that detection is not blocked by sending.
+    # A single run gives up after a few attempts and leaves the notification in the outbox for
+    # the next run, the daemon keeps retrying.
+    dispatcher = NotificationDispatcher(
+        telegram, discord,
+        telegram_messages_per_minute=cfg.get('telegram_messages_per_minute', 20),
+        discord_messages_per_minute=cfg.get('discord_messages_per_minute', 30),
+        max_attempts=None if daemon else 5,
+        on_delivered=outbox.ack,
+        digest_window=cfg.get('notification_digest_window', 5),
+        direct_messages_per_second=cfg.get('subscriber_messages_per_second', 20))
+
+    # Users can watch Pillars to get their events as direct messages
+    subscriptions = None
+    if cfg.get('subscriptions_enabled', False):
+        subscriptions = SubscriptionManager(
+            telegram, store, dispatcher,
+            events=cfg.get('subscription_events', ['inactive', 'active', 'name_changed', 'reward_share_changed']),
+            max_watchlist_size=cfg.get('subscription_max_watchlist_size', 50))
+
+    # Send notifications that were not delivered before the previous run stopped
+    for n in outbox.get_pending():
+        dispatcher.dispatch(n)
+
+    if log is None:
+        log = create_log(cfg)
+    if api is not None:
+        api.add_profile(cfg.get('name', ''), history)
+
+    return {'name': cfg.get('name', ''), 'cfg': cfg, 'files': files, 'node': node, 'log': log, 'api': api, 'telegram': telegram, 'discord': discord,
+            'dispatcher': dispatcher, 'epoch_tracker': epoch_tracker,
+            'missed_momentum_detector': missed_momentum_detector, 'outbox': outbox, 'store': store, 'history': history,
+            'pinned_stats_renderer': pinned_stats_renderer, 'reward_collector': reward_collector,
+            'subscriptions': subscriptions, 'ranking': ranking}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon', action='store_true',
+                        help='keep running and check for changes on every new momentum')
+    args = parser.parse_args()
+
+    # Get current file path
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    # Read config
+    cfg = read_file(f'{path}/config/config.json')
+
+    trackers = create_trackers(cfg, path, daemon=args.daemon)
+
+    if args.daemon:
+        run_daemon(trackers)
+        return
+
+    # Run once. Queued notifications are delivered and the states are saved even if the run is stopped by an error.
+    # The states are saved after the deliveries, which update the pinned stats state.
+    states = {}
+    for tracker in trackers:
+        states[tracker['name']] = load_state(tracker['store'])
+    try:
+        for group in get_tracker_groups(trackers):
+            run_trackers(group, states)
+    finally:
+        for tracker in trackers:
+            tracker['dispatcher'].join()
+        for tracker in trackers:
+            save_state(states[tracker['name']], tracker['store'])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,172 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pillar_tracker
+from utils.pillar import pillars_from_lists
+from utils.pillar_diff import diff_pillars
+
+
+def read_snapshots(file_path, start_offset=0, end_offset=None):
+    # Yields the byte offset, momentum height, momentum timestamp and Pillars of every recorded snapshot
+    with open(file_path, 'rb') as f:
+        f.seek(start_offset)
+        offset = start_offset
+        for line in f:
+            if end_offset is not None and offset >= end_offset:
+                break
+            line_offset = offset
+            offset = offset + len(line)
+            try:
+                d = json.loads(line)
+            except ValueError:
+                # A crash can leave a partially written last line
+                continue
+            yield line_offset, d['height'], d['timestamp'], pillars_from_lists(d['pillars'])
+
+
+def get_line_offsets(file_path):
+    offsets = []
+    with open(file_path, 'rb') as f:
+        offset = 0
+        for line in f:
+            offsets.append(offset)
+            offset = offset + len(line)
+    return offsets
+
+
+def create_chunks(offsets, file_size, chunk_size):
+    # Every chunk also reads the snapshot before it to compare its first snapshot against
+    chunks = []
+    for start in range(0, len(offsets), chunk_size):
+        end = start + chunk_size
+        chunks.append({'previous_offset': offsets[start - 1] if start > 0 else offsets[start],
+                       'start_offset': offsets[start],
+                       'end_offset': offsets[end] if end < len(offsets) else file_size})
+    return chunks
+
+
+def replay_chunk(file_path, cfg, previous_offset, start_offset, end_offset):
+    # Run the Pillar event detection on the snapshots from start_offset to end_offset with sending
+    # disabled. Returns the detected events and the Pillar events of every snapshot for the missed
+    # momentum detection, which depends on the state of the previous snapshots. The Pillars are only
+    # returned if the owner addresses have changed.
+    cached_pillars = None
+    snapshots = []
+
+    # The detection prints errors instead of sending them
+    with contextlib.redirect_stdout(io.StringIO()):
+        for offset, height, timestamp, pillars in read_snapshots(file_path, previous_offset, end_offset):
+            snapshot = {'height': height, 'timestamp': timestamp, 'pillar_events': None, 'events': [],
+                        'pillars': None}
+            if cached_pillars is None or pillars.keys() != cached_pillars.keys():
+                snapshot['pillars'] = pillars
+            if cached_pillars is not None:
+                snapshot['pillar_events'] = diff_pillars(cached_pillars, pillars)
+                notifications = []
+                pillar_tracker.check_and_send_pillar_events(None, notifications, cfg, snapshot['pillar_events'])
+                snapshot['events'] = get_events(height, timestamp, notifications)
+            if offset >= start_offset:
+                snapshots.append(snapshot)
+            cached_pillars = pillars
+    return snapshots
+
+
+def get_events(height, timestamp, notifications):
+    events = []
+    for n in notifications:
+        key = n['key'].split(':')
+        events.append({'height': height, 'timestamp': timestamp, 'type': key[0],
+                       'ownerAddress': key[1] if len(key) > 1 else None, 'message': n['message']})
+    return events
+
+
+def run_replay(args, cfg):
+    # The chunks are replayed in parallel and their results are consumed in order. The missed momentum
+    # detection runs on the results as they arrive, so the state is handed over without replaying again.
+    offsets = get_line_offsets(args.file)
+    chunks = create_chunks(offsets, os.path.getsize(args.file), args.chunk_size)
+    detector = pillar_tracker.create_missed_momentum_detector(cfg)
+    momentum_status = {}
+    pillars = {}
+    events = []
+    snapshot_count = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        results = executor.map(replay_chunk, [args.file] * len(chunks), [cfg] * len(chunks),
+                               [chunk['previous_offset'] for chunk in chunks],
+                               [chunk['start_offset'] for chunk in chunks],
+                               [chunk['end_offset'] for chunk in chunks])
+        with contextlib.redirect_stdout(io.StringIO()):
+            for snapshots in results:
+                for snapshot in snapshots:
+                    snapshot_count = snapshot_count + 1
+                    if snapshot['pillars'] is not None:
+                        pillars = snapshot['pillars']
+                    events.extend(snapshot['events'])
+                    if snapshot['pillar_events'] is None:
+                        continue
+                    notifications = []
+                    momentum_status = pillar_tracker.check_and_send_missed_momentums_message(
+                        None, notifications, cfg, detector, pillars, momentum_status, snapshot['pillar_events'])['data']
+                    events.extend(get_events(snapshot['height'], snapshot['timestamp'], notifications))
+    return events, snapshot_count, len(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Replay recorded Pillar snapshots through the detection without sending notifications')
+    parser.add_argument('file', help='snapshot file recorded with snapshot_record_file')
+    parser.add_argument('--config', help='config file, config/config.json by default')
+    parser.add_argument('--set', action='append', default=[], metavar='KEY=VALUE',
+                        help='override a config value, for example missed_momentum_threshold=3')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=10000, help='snapshots per chunk')
+    parser.add_argument('--output', help='write the events to this file instead of printing them')
+    args = parser.parse_args()
+
+    path = os.path.dirname(os.path.abspath(__file__))
+    if args.config is not None:
+        cfg = pillar_tracker.read_file(args.config)
+    elif os.path.exists(f'{path}/config/config.json'):
+        cfg = pillar_tracker.read_file(f'{path}/config/config.json')
+    else:
+        cfg = pillar_tracker.read_file(f'{path}/config/example.config.json')
+    for value in args.set:
+        key, value = value.split('=', 1)
+        try:
+            cfg[key] = json.loads(value)
+        except ValueError:
+            cfg[key] = value
+
+    # Notifications are only collected. Errors are printed and not sent to the developer chat.
+    cfg = dict(cfg, telegram_channel_id='replay', discord_channel_webhook='', telegram_dev_chat_id='')
+
+    print(f'{str(datetime.datetime.now())}: Replaying {args.file}')
+    start = time.perf_counter()
+    events, snapshots, chunk_count = run_replay(args, cfg)
+    duration = time.perf_counter() - start
+
+    counts = {}
+    with open(args.output, 'w') if args.output is not None else contextlib.nullcontext(None) as f:
+        for event in events:
+            counts[event['type']] = counts.get(event['type'], 0) + 1
+            if f is not None:
+                f.write(json.dumps(event) + '\n')
+            else:
+                print(json.dumps(event))
+
+    print(f'snapshots: {snapshots}')
+    print(f'chunks: {chunk_count}')
+    print(f'events: {counts}')
+    print(f'duration: {round(duration, 2)}s')
+    print(f'snapshots_per_second: {round(snapshots / duration, 2) if duration > 0 else 0}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,6 +1,7 @@
-from utils.http_wrapper import HttpWrapper
+class DiscordWrapper(object):
 
+    def __init__(self, http):
+        self.http = http
 
-class DiscordWrapper(object):
     def webhook_send_message_to_channel(self, webhook_url, message):
-        return HttpWrapper.post(webhook_url, {'content': message})
+        return self.http.post(webhook_url, {'content': message}, idempotent=False)
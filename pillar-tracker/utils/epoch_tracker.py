@@ -0,0 +1,66 @@
+class EpochTracker(object):
+    # Predicts the reward epoch from the momentum timestamp. Epoch n starts at
+    # genesis_timestamp + n * epoch_length and its rewards become available once it has ended.
+
+    def __init__(self, store, genesis_timestamp=1637755200, epoch_length=86400, check_window=3600, confirmations=1,
+                 late_check_interval=300, max_late_check_interval=3600):
+        self.store = store
+        self.genesis_timestamp = genesis_timestamp
+        self.epoch_length = epoch_length
+        self.check_window = check_window
+        self.confirmations = confirmations
+        self.late_check_interval = late_check_interval
+        self.max_late_check_interval = max_late_check_interval
+
+        # Momentum timestamp of the next check and the interval after it while an epoch is late. Kept
+        # in the state store so that the backoff also applies to runs from cron.
+        late_check = store.get_value('reward_late_check', {'timestamp': None, 'interval': late_check_interval})
+        self.next_late_check_timestamp = late_check['timestamp']
+        self.next_late_check_interval = late_check['interval']
+
+    def get_expected_reward_epoch(self, momentum_timestamp):
+        # The latest epoch that has ended
+        return (momentum_timestamp - self.genesis_timestamp) // self.epoch_length - 1
+
+    def needs_check(self, cached_epoch_data, momentum_timestamp):
+        # Rewards are only queried after a boundary until the new epoch has been confirmed. After
+        # check_window seconds a late epoch is checked again after an interval that doubles on every
+        # check, starting at late_check_interval up to max_late_check_interval seconds.
+        if cached_epoch_data is None:
+            return True
+        expected_epoch = self.get_expected_reward_epoch(momentum_timestamp)
+        if cached_epoch_data['epoch'] >= expected_epoch:
+            if self.next_late_check_timestamp is not None:
+                self.__set_late_check(None, self.late_check_interval)
+            return False
+        boundary_timestamp = self.genesis_timestamp + (expected_epoch + 1) * self.epoch_length
+        if momentum_timestamp - boundary_timestamp < self.check_window:
+            return True
+
+        if self.next_late_check_timestamp is not None and momentum_timestamp < self.next_late_check_timestamp:
+            return False
+        self.__set_late_check(momentum_timestamp + self.next_late_check_interval,
+                              min(self.next_late_check_interval * 2, self.max_late_check_interval))
+        return True
+
+    def resolve(self, cached_epoch_data, responses, momentum_timestamp):
+        # Returns the new epoch data from the reward epochs of the reference addresses. Keeps the
+        # cached data until enough addresses report the expected epoch.
+        results = [r for r in responses if 'error' not in r]
+        if len(results) == 0:
+            if cached_epoch_data is None and len(responses) > 0:
+                return responses[0]
+            return cached_epoch_data
+
+        expected_epoch = self.get_expected_reward_epoch(momentum_timestamp)
+        confirmed = [r for r in results if r['epoch'] >= expected_epoch]
+        if len(confirmed) >= min(self.confirmations, len(responses)):
+            return max(confirmed, key=lambda r: r['epoch'])
+        if cached_epoch_data is None:
+            return max(results, key=lambda r: r['epoch'])
+        return cached_epoch_data
+
+    def __set_late_check(self, timestamp, interval):
+        self.next_late_check_timestamp = timestamp
+        self.next_late_check_interval = interval
+        self.store.set_value('reward_late_check', {'timestamp': timestamp, 'interval': interval})
@@ -0,0 +1,185 @@
+import os
+import struct
+import threading
+import time
+
+
+class HistoryStore(object):
+    # One file per Pillar with a fixed-width record whenever one of the Pillar's values changes:
+    # momentum height, timestamp, weight, produced momentums, expected momentums,
+    # momentum reward %, delegate reward % and rank
+    PILLAR_RECORD = struct.Struct('<QIQIIBBH')
+
+    # One record per stored snapshot: momentum height and timestamp
+    SNAPSHOT_RECORD = struct.Struct('<QI')
+
+    FIELDS = ('height', 'timestamp', 'weight', 'producedMomentums', 'expectedMomentums',
+              'giveMomentumRewardPercentage', 'giveDelegateRewardPercentage', 'rank')
+
+    # Seconds between retention and downsampling runs
+    MAINTENANCE_INTERVAL = 86400
+
+    def __init__(self, dir_path, retention_days=365, downsample_after_days=30, downsample_interval=360):
+        self.dir_path = dir_path
+        self.retention_days = retention_days
+        self.downsample_after_days = downsample_after_days
+        self.downsample_interval = downsample_interval
+        self.lock = threading.Lock()
+
+        # Last stored values per Pillar, used to only store changes
+        self.last_values = {}
+        self.last_height = 0
+
+        if not os.path.exists(dir_path):
+            os.makedirs(dir_path, exist_ok=True)
+        self.__load()
+
+    def append(self, height, pillars, timestamp=None):
+        # Store a snapshot of all Pillars as returned by NodeRpcWrapper.get_all_pillars
+        if timestamp is None:
+            timestamp = int(time.time())
+        with self.lock:
+            if height <= self.last_height:
+                return
+            for owner_address, pillar in pillars.items():
+                values = (pillar.weight, pillar.produced_momentums, pillar.expected_momentums,
+                          pillar.give_momentum_reward_percentage, pillar.give_delegate_reward_percentage, pillar.rank)
+                if self.last_values.get(owner_address) != values:
+                    with open(self.__get_pillar_file_path(owner_address), 'ab') as f:
+                        f.write(self.PILLAR_RECORD.pack(
+                            height, timestamp, *values))
+                    self.last_values[owner_address] = values
+            with open(self.__get_snapshot_file_path(), 'ab') as f:
+                f.write(self.SNAPSHOT_RECORD.pack(height, timestamp))
+            self.last_height = height
+
+    def get_pillar_history(self, owner_address, from_height=0, to_height=None):
+        # Returns the Pillar's values at from_height followed by every change up to to_height
+        file_path = self.__get_pillar_file_path(owner_address)
+        if not os.path.exists(file_path):
+            return []
+        with self.lock:
+            with open(file_path, 'rb') as f:
+                count = os.fstat(f.fileno()).st_size // self.PILLAR_RECORD.size
+
+                # The record in effect at from_height is the last one at or before it
+                start = max(0, self.__bisect(f, self.PILLAR_RECORD, count, from_height + 1) - 1)
+                if to_height is None:
+                    end = count
+                else:
+                    end = self.__bisect(f, self.PILLAR_RECORD, count, to_height + 1)
+                if end <= start:
+                    return []
+                f.seek(start * self.PILLAR_RECORD.size)
+                data = f.read((end - start) * self.PILLAR_RECORD.size)
+        return [dict(zip(self.FIELDS, r)) for r in self.PILLAR_RECORD.iter_unpack(data)]
+
+    def get_snapshots(self, from_height=0, to_height=None):
+        # Returns the momentum heights and timestamps of the stored snapshots
+        file_path = self.__get_snapshot_file_path()
+        if not os.path.exists(file_path):
+            return []
+        with self.lock:
+            with open(file_path, 'rb') as f:
+                count = os.fstat(f.fileno()).st_size // self.SNAPSHOT_RECORD.size
+                start = self.__bisect(f, self.SNAPSHOT_RECORD, count, from_height)
+                if to_height is None:
+                    end = count
+                else:
+                    end = self.__bisect(f, self.SNAPSHOT_RECORD, count, to_height + 1)
+                if end <= start:
+                    return []
+                f.seek(start * self.SNAPSHOT_RECORD.size)
+                data = f.read((end - start) * self.SNAPSHOT_RECORD.size)
+        return list(self.SNAPSHOT_RECORD.iter_unpack(data))
+
+    def run_maintenance(self, now=None):
+        # Apply the retention and downsampling policies at most once per maintenance interval
+        if now is None:
+            now = int(time.time())
+        marker_file_path = f'{self.dir_path}/maintenance'
+        if os.path.exists(marker_file_path) and now - os.path.getmtime(marker_file_path) < self.MAINTENANCE_INTERVAL:
+            return
+
+        with self.lock:
+            retention_cutoff = now - self.retention_days * 86400 if self.retention_days else None
+            downsample_cutoff = now - self.downsample_after_days * 86400 if self.downsample_after_days else None
+            for file_name in os.listdir(self.dir_path):
+                if file_name.endswith('.bin'):
+                    if file_name == 'snapshots.bin':
+                        record = self.SNAPSHOT_RECORD
+                    else:
+                        record = self.PILLAR_RECORD
+                    self.__compact_file(
+                        f'{self.dir_path}/{file_name}', record, retention_cutoff, downsample_cutoff)
+        open(marker_file_path, 'w').close()
+        os.utime(marker_file_path, (now, now))
+
+    def __compact_file(self, file_path, record, retention_cutoff, downsample_cutoff):
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        records = list(record.iter_unpack(data))
+        kept = []
+        for i, r in enumerate(records):
+            height, timestamp = r[0], r[1]
+
+            # The last record holds the current values and is always kept
+            is_last = i + 1 == len(records)
+            if retention_cutoff is not None and timestamp < retention_cutoff and not is_last:
+                continue
+
+            # Keep only the last record per height interval of old data
+            if downsample_cutoff is not None and timestamp < downsample_cutoff and not is_last:
+                next_height = records[i + 1][0]
+                if next_height // self.downsample_interval == height // self.downsample_interval:
+                    continue
+            kept.append(r)
+
+        if len(kept) == len(records):
+            return
+        tmp_file_path = f'{file_path}.tmp'
+        with open(tmp_file_path, 'wb') as f:
+            f.write(b''.join(record.pack(*r) for r in kept))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file_path, file_path)
+
+    def __bisect(self, f, record, count, height):
+        # Index of the first record with a height >= height. Records are ordered by height.
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid * record.size)
+            if struct.unpack('<Q', f.read(8))[0] < height:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def __load(self):
+        # Read the last record of every file. A crash can leave a partially written record at the end.
+        for file_name in os.listdir(self.dir_path):
+            if not file_name.endswith('.bin'):
+                continue
+            file_path = f'{self.dir_path}/{file_name}'
+            record = self.SNAPSHOT_RECORD if file_name == 'snapshots.bin' else self.PILLAR_RECORD
+            size = os.path.getsize(file_path)
+            if size % record.size != 0:
+                with open(file_path, 'r+b') as f:
+                    f.truncate(size - size % record.size)
+                size = size - size % record.size
+            if size == 0:
+                continue
+            with open(file_path, 'rb') as f:
+                f.seek(size - record.size)
+                r = record.unpack(f.read(record.size))
+            if file_name == 'snapshots.bin':
+                self.last_height = r[0]
+            else:
+                self.last_values[file_name[:-4]] = r[2:]
+
+    def __get_pillar_file_path(self, owner_address):
+        return f'{self.dir_path}/{owner_address}.bin'
+
+    def __get_snapshot_file_path(self):
+        return f'{self.dir_path}/snapshots.bin'
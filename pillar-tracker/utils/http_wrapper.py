@@ -1,16 +1,70 @@
-import requests
-
-
-class HttpWrapper(object):
-
-    @staticmethod
-    def get(url):
-        return requests.get(
-            url,)
-
-    @staticmethod
-    def post(url, data, headers={
-        'Content-type': 'application/json',
-    }):
-        return requests.post(
-            url, headers=headers, json=data)
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpWrapper(object):
+    # Responses that are retried. Any other response is returned to the caller as is.
+    RETRY_STATUS_CODES = (502, 503, 504)
+
+    def __init__(self, connect_timeout=5, read_timeout=30, max_retries=2, backoff_factor=0.5, max_backoff=10, pool_maxsize=10):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.pool_maxsize = pool_maxsize
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def get(self, url, params=None, idempotent=True):
+        return self.__request('GET', url, idempotent, params=params)
+
+    def post(self, url, data, headers={
+        'Content-type': 'application/json',
+    }, stream=False, idempotent=True):
+        # With stream=True the body is read by the caller, who has to close the response
+        return self.__request('POST', url, idempotent, headers=headers, json=data, stream=stream)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions = {}
+
+    def __request(self, method, url, idempotent, **kwargs):
+        # Requests that are not idempotent, like sending a message, may have been processed even if
+        # no response was received. They are only retried if the connection could not be opened.
+        session = self.__get_session(url)
+        attempt = 0
+        while True:
+            try:
+                r = session.request(method, url, timeout=self.timeout, **kwargs)
+                if r.status_code not in self.RETRY_STATUS_CODES or not idempotent or attempt >= self.max_retries:
+                    return r
+                r.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries or not (idempotent or isinstance(e, requests.exceptions.ConnectTimeout)):
+                    raise
+            time.sleep(self.__get_backoff(attempt))
+            attempt = attempt + 1
+
+    def __get_backoff(self, attempt):
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * (2 ** attempt)))
+
+    def __get_session(self, url):
+        # One keep-alive session per host so that connections are reused between calls
+        u = urlsplit(url)
+        key = f'{u.scheme}://{u.netloc}'
+        with self.lock:
+            if key not in self.sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                session.mount(key, adapter)
+                self.sessions[key] = session
+            return self.sessions[key]
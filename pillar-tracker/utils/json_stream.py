@@ -0,0 +1,60 @@
+import json
+import re
+
+
+class JsonArrayStream(object):
+    # Decodes the items of the array with the given key from a JSON document that arrives in
+    # chunks. Only the item that is being received is kept in memory. The rest of the document
+    # is returned by get_envelope() with the array left empty.
+    SEPARATORS = re.compile(r'[\s,]*')
+
+    def __init__(self, key):
+        self.pattern = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+        self.decoder = json.JSONDecoder()
+        self.state = 'prefix'
+        self.buffer = ''
+        self.prefix = ''
+        self.suffix = ''
+
+    def feed(self, chunk):
+        # Returns the items that have been completed by the chunk
+        self.buffer = self.buffer + chunk
+        items = []
+
+        if self.state == 'prefix':
+            m = self.pattern.search(self.buffer)
+            if m is None:
+                return items
+            self.prefix = self.buffer[:m.end()]
+            self.buffer = self.buffer[m.end():]
+            self.state = 'items'
+
+        # Decode from an offset and trim the buffer once per chunk
+        i = 0
+        while self.state == 'items':
+            i = self.SEPARATORS.match(self.buffer, i).end()
+            if i == len(self.buffer):
+                break
+            if self.buffer[i] == ']':
+                self.state = 'suffix'
+                break
+            try:
+                item, i = self.decoder.raw_decode(self.buffer, i)
+            except ValueError:
+                # The item is not complete yet
+                break
+            items.append(item)
+        self.buffer = self.buffer[i:]
+
+        if self.state == 'suffix':
+            self.suffix = self.suffix + self.buffer
+            self.buffer = ''
+        return items
+
+    def get_envelope(self):
+        # The document without the array items. Raises ValueError if the document is incomplete.
+        if self.state == 'prefix':
+            return json.loads(self.buffer)
+        if self.state != 'suffix':
+            raise ValueError('Incomplete array')
+        return json.loads(self.prefix + self.suffix)
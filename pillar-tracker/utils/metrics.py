@@ -0,0 +1,156 @@
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class Metrics(object):
+    # Counters, gauges and histograms in the Prometheus text format. Metrics are identified by
+    # name and labels, for example inc('notifications_sent_total', {'sink': 'telegram'}).
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, labels=None, value=1):
+        key = self.__get_key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        key = self.__get_key(name, labels)
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name, value, labels=None):
+        key = self.__get_key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = {'buckets': [0] * len(self.BUCKETS), 'count': 0, 'sum': 0}
+            h = self.histograms[key]
+            i = bisect.bisect_left(self.BUCKETS, value)
+            if i < len(self.BUCKETS):
+                h['buckets'][i] += 1
+            h['count'] += 1
+            h['sum'] += value
+
+    @contextmanager
+    def time(self, name, labels=None):
+        # Observe the duration of the block in seconds
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def render(self):
+        # Prometheus text exposition format
+        with self.lock:
+            lines = []
+            for metric_type, metrics in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted(set(key[0] for key in metrics)):
+                    lines.append(f'# TYPE {name} {metric_type}')
+                    for key in sorted(k for k in metrics if k[0] == name):
+                        lines.append(f'{name}{self.__format_labels(key[1])} {metrics[key]}')
+
+            for name in sorted(set(key[0] for key in self.histograms)):
+                lines.append(f'# TYPE {name} histogram')
+                for key in sorted(k for k in self.histograms if k[0] == name):
+                    h = self.histograms[key]
+                    cumulative = 0
+                    for bucket, count in zip(self.BUCKETS, h['buckets']):
+                        cumulative = cumulative + count
+                        lines.append(f'{name}_bucket{self.__format_labels(key[1] + (("le", str(bucket)),))} {cumulative}')
+                    lines.append(f'{name}_bucket{self.__format_labels(key[1] + (("le", "+Inf"),))} {h["count"]}')
+                    lines.append(f'{name}_sum{self.__format_labels(key[1])} {h["sum"]}')
+                    lines.append(f'{name}_count{self.__format_labels(key[1])} {h["count"]}')
+            return '\n'.join(lines) + '\n'
+
+    def to_dict(self):
+        # Compact snapshot for the JSON log. Histograms are reduced to their count and sum.
+        with self.lock:
+            d = {}
+            for key, value in list(self.counters.items()) + list(self.gauges.items()):
+                d[self.__format_key(key)] = value
+            for key, h in self.histograms.items():
+                d[self.__format_key(key)] = {'count': h['count'], 'sum': round(h['sum'], 6)}
+            return d
+
+    def __get_key(self, name, labels):
+        if labels is None:
+            return (name, ())
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def __format_labels(self, labels):
+        if len(labels) == 0:
+            return ''
+        values = ','.join(f'{k}="{self.__escape(v)}"' for k, v in labels)
+        return '{' + values + '}'
+
+    def __format_key(self, key):
+        return f'{key[0]}{self.__format_labels(key[1])}'
+
+    def __escape(self, value):
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsServer(object):
+    # Serves the metrics on http://host:port/metrics
+
+    def __init__(self, registry, host='127.0.0.1', port=9100):
+        self.registry = registry
+        self.server = ThreadingHTTPServer((host, port), self.__create_handler())
+        self.server.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __create_handler(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_response(404)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                data = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class JsonLog(object):
+    # Appends one JSON object per line
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+
+    def write(self, event, **fields):
+        entry = dict({'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()), 'event': event}, **fields)
+        with self.lock:
+            with open(self.file_path, 'a') as f:
+                f.write(json.dumps(entry) + '\n')
+
+
+# Registry shared by all modules
+metrics = Metrics()
@@ -0,0 +1,51 @@
+class MissedMomentumDetector(object):
+    # Detects inactive Pillars from the produced and expected momentums between snapshots.
+    # A producing Pillar becomes inactive once it has missed inactive_threshold of its last
+    # window expected momentums and did not produce since the previous snapshot. An inactive
+    # Pillar is producing again once it has produced active_threshold momentums. The window is
+    # cleared on every change of state.
+    INACTIVE = 'inactive'
+    ACTIVE = 'active'
+
+    def __init__(self, window=10, inactive_threshold=5, active_threshold=1):
+        self.window = window
+        self.inactive_threshold = inactive_threshold
+        self.active_threshold = active_threshold
+
+    def create_status(self, pillar):
+        return {'name': pillar.name, 'missedMomentums': 0, 'isProducing': True, 'window': []}
+
+    def update(self, status, cached_pillar, new_pillar):
+        # Returns the new status and INACTIVE or ACTIVE if the Pillar has changed state
+        expected = self.__get_delta(cached_pillar.expected_momentums, new_pillar.expected_momentums)
+        produced = self.__get_delta(cached_pillar.produced_momentums, new_pillar.produced_momentums)
+
+        # Keep the deltas of the last window expected momentums
+        window = status.get('window', []) + [[expected, produced]]
+        expected_in_window = sum(e for e, p in window)
+        while len(window) > 1 and expected_in_window - window[0][0] >= self.window:
+            expected_in_window = expected_in_window - window[0][0]
+            window = window[1:]
+        missed_in_window = sum(max(0, e - p) for e, p in window)
+        produced_in_window = sum(p for e, p in window)
+
+        is_producing = status['isProducing']
+        transition = None
+        if is_producing and produced == 0 and missed_in_window >= self.inactive_threshold:
+            is_producing = False
+            transition = self.INACTIVE
+        elif not is_producing and produced_in_window >= self.active_threshold:
+            is_producing = True
+            transition = self.ACTIVE
+        if transition is not None:
+            window = []
+            missed_in_window = 0
+
+        return {'name': new_pillar.name, 'missedMomentums': missed_in_window,
+                'isProducing': is_producing, 'window': window}, transition
+
+    def __get_delta(self, previous, current):
+        # The momentum stats are reset at the start of every epoch
+        if current < previous:
+            return current
+        return current - previous
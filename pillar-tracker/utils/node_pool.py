@@ -0,0 +1,135 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.node_rpc_wrapper import NodeRpcWrapper
+
+
+class NodePool(object):
+    # Routes calls to the freshest, fastest node and fails over to the next node on errors.
+    # Has the same interface as NodeRpcWrapper.
+
+    def __init__(self, node_urls, http, probe_interval=30, max_height_lag=2, quorum=1, quorum_height_tolerance=2,
+                 page_size=1000, page_workers=4):
+        self.nodes = [NodeRpcWrapper(node_url=node_url, http=http, page_size=page_size, page_workers=page_workers)
+                      for node_url in node_urls]
+        self.probe_interval = probe_interval
+        self.max_height_lag = max_height_lag
+        self.quorum = min(quorum, len(self.nodes))
+        self.quorum_height_tolerance = quorum_height_tolerance
+        self.executor = ThreadPoolExecutor(max_workers=len(self.nodes))
+
+        # Latest probe result per node URL: momentum height, latency in seconds and health
+        self.status = {node.node_url: {'height': 0, 'latency': 0, 'healthy': True}
+                       for node in self.nodes}
+        self.last_probe = None
+
+    def get_latest_momentum(self):
+        return self.__call(lambda node: node.get_latest_momentum(),
+                           lambda r: [r])
+
+    def get_all_pillars(self):
+        return self.__call(lambda node: node.get_all_pillars(),
+                           lambda r: [r])
+
+    def get_reward_epoch(self, address):
+        return self.__call(lambda node: node.get_reward_epoch(address),
+                           lambda r: [r])
+
+    def get_reward_epochs(self, addresses):
+        return self.__call(lambda node: node.get_reward_epochs(addresses),
+                           lambda r: r.values())
+
+    def get_reward_histories(self, requests):
+        return self.__call(lambda node: node.get_reward_histories(requests),
+                           lambda r: r.values())
+
+    def get_poll_data(self, reward_addresses):
+        r, node = self.__call_node(lambda node: node.get_poll_data(reward_addresses),
+                                   lambda r: [r['latest_momentum'], r['pillar_data']] + list(r['epoch_data'].values()))
+
+        # Cross-check the Pillar data with other nodes before it is used to detect dismantled
+        # or inactive Pillars
+        if self.quorum > 1 and 'error' not in r['latest_momentum'] and 'error' not in r['pillar_data']:
+            r['pillar_data']['confirmed'], r['pillar_data']['disputed'] = self.__confirm_pillars(
+                node, r['latest_momentum']['height'], r['pillar_data']['pillars'])
+        return r
+
+    def probe(self):
+        # Get the momentum height and latency of all nodes concurrently
+        def probe_node(node):
+            start = time.monotonic()
+            r = node.get_latest_momentum()
+            return node, r, time.monotonic() - start
+
+        for node, r, latency in self.executor.map(probe_node, self.nodes):
+            if 'error' in r:
+                self.status[node.node_url] = {'height': 0, 'latency': latency, 'healthy': False}
+                print(f'Node {node.node_url} is not available: {r["error"]}')
+            else:
+                self.status[node.node_url] = {'height': r['height'], 'latency': latency, 'healthy': True}
+
+        # Nodes that lag behind the freshest node are not used until they have caught up
+        max_height = max(s['height'] for s in self.status.values())
+        for node_url, s in self.status.items():
+            if s['healthy'] and s['height'] < max_height - self.max_height_lag:
+                s['healthy'] = False
+                print(f'Node {node_url} is behind: {s["height"]} < {max_height}')
+        self.last_probe = time.monotonic()
+
+    def get_nodes(self):
+        # Healthy nodes ordered by latency followed by the other nodes ordered by height
+        if len(self.nodes) > 1 and (self.last_probe is None or time.monotonic() - self.last_probe >= self.probe_interval):
+            self.probe()
+        healthy = [n for n in self.nodes if self.status[n.node_url]['healthy']]
+        unhealthy = [n for n in self.nodes if not self.status[n.node_url]['healthy']]
+        return sorted(healthy, key=lambda n: self.status[n.node_url]['latency']) + \
+            sorted(unhealthy, key=lambda n: -self.status[n.node_url]['height'])
+
+    def __call(self, call, get_results):
+        return self.__call_node(call, get_results)[0]
+
+    def __call_node(self, call, get_results):
+        # Return the first response without errors. Return the last response if all nodes fail.
+        for node in self.get_nodes():
+            r = call(node)
+            if not any('error' in result for result in get_results(r)):
+                return r, node
+            if len(self.nodes) > 1:
+                print(f'Node {node.node_url} failed. Trying the next node.')
+                self.status[node.node_url]['healthy'] = False
+        return r, node
+
+    def __confirm_pillars(self, primary, height, pillars):
+        # Compare the Pillar data with other nodes that are at most quorum_height_tolerance momentums
+        # away. A Pillar is disputed if fewer than quorum nodes agree on whether it exists and on its
+        # momentum stats, which can differ by at most one per momentum between the heights.
+        # Returns whether enough nodes could be compared and the disputed owner addresses.
+        others = [n for n in self.get_nodes() if n is not primary]
+        snapshots = []
+        for r in self.executor.map(lambda node: node.get_pillar_snapshot(), others[:self.quorum - 1]):
+            if 'error' in r['latest_momentum'] or 'error' in r['pillar_data']:
+                continue
+            height_difference = abs(r['latest_momentum']['height'] - height)
+            if height_difference <= self.quorum_height_tolerance:
+                snapshots.append((r['pillar_data']['pillars'], height_difference))
+        if len(snapshots) < self.quorum - 1:
+            return False, set()
+
+        disputed = set()
+        owner_addresses = set(pillars)
+        for other_pillars, height_difference in snapshots:
+            owner_addresses.update(other_pillars)
+        for owner_address in owner_addresses:
+            confirmations = 1
+            for other_pillars, height_difference in snapshots:
+                if self.__agrees(pillars.get(owner_address), other_pillars.get(owner_address), height_difference):
+                    confirmations = confirmations + 1
+            if confirmations < self.quorum:
+                disputed.add(owner_address)
+        return True, disputed
+
+    def __agrees(self, pillar, other_pillar, height_difference):
+        if pillar is None or other_pillar is None:
+            return pillar is None and other_pillar is None
+        return abs(pillar.produced_momentums - other_pillar.produced_momentums) <= height_difference and \
+            abs(pillar.expected_momentums - other_pillar.expected_momentums) <= height_difference
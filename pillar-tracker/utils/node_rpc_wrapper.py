@@ -1,62 +1,251 @@
-import json
-import datetime
-from utils.http_wrapper import HttpWrapper
-
-
-class NodeRpcWrapper(object):
-
-    def __init__(self, node_url):
-        self.node_url = node_url
-
-    def get_latest_momentum(self):
-        r = self.__ledger_get_frontier_momentum()
-        if r.status_code == 200:
-            d = json.loads(r.text)
-            try:
-                return {'height': d['result']['height'], 'timestamp': str(datetime.datetime.now())}
-            except KeyError:
-                return {'error': 'KeyError: get_latest_momentum'}
-        else:
-            return {'error': f'Bad response: get_latest_momentum {r.status_code}'}
-
-    def get_all_pillars(self):
-        r = self.__embedded_pillar_get_all()
-        if r.status_code == 200:
-            d = json.loads(r.text)
-            pillars = {'pillars': {}, 'timestamp': str(
-                datetime.datetime.now())}
-            try:
-                for pillar in d['result']['list']:
-                    pillars['pillars'][pillar['ownerAddress']] = {'name': pillar['name'], 'ownerAddress': pillar['ownerAddress'], 'currentStats': pillar['currentStats'], 'weight': pillar['weight'],
-                                                                  'giveMomentumRewardPercentage': pillar['giveMomentumRewardPercentage'], 'giveDelegateRewardPercentage': pillar['giveDelegateRewardPercentage'], 'rank': pillar['rank']}
-            except KeyError:
-                return {'error': 'KeyError: get_all_pillars'}
-            return pillars
-        else:
-            return {'error': f'Bad response: get_all_pillars {r.status_code}'}
-
-    def get_reward_epoch(self, address):
-        r = self.__embedded_pillar_get_frontier_reward_by_page(address)
-        if r.status_code == 200:
-            d = json.loads(r.text)
-            if len(d['result']['list']) > 0:
-                try:
-                    return {'epoch': d['result']['list'][0]['epoch'], 'reward': d['result']['list'][0]['znnAmount'], 'timestamp': str(datetime.datetime.now())}
-                except KeyError:
-                    return {'error': 'KeyError: get_reward_epoch'}
-            else:
-                return {'error': f'Result list empty: get_reward_epoch'}
-        else:
-            return {'error': f'Bad response: get_reward_epoch {r.status_code}'}
-
-    def __ledger_get_frontier_momentum(self):
-        return HttpWrapper.post(self.node_url, {'jsonrpc': '2.0', 'id': 1,
-                                                'method': 'ledger.getFrontierMomentum', 'params': []})
-
-    def __embedded_pillar_get_all(self, params=[0, 1000]):
-        return HttpWrapper.post(self.node_url, {'jsonrpc': '2.0', 'id': 1,
-                                                'method': 'embedded.pillar.getAll', 'params': params})
-
-    def __embedded_pillar_get_frontier_reward_by_page(self, address):
-        return HttpWrapper.post(self.node_url, {'jsonrpc': '2.0', 'id': 1,
-                                                'method': 'embedded.pillar.getFrontierRewardByPage', 'params': [address, 0, 1]})
+import json
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils.json_stream import JsonArrayStream
+from utils.metrics import metrics
+from utils.pillar import Pillar
+
+
+class NodeRpcWrapper(object):
+    STREAM_CHUNK_SIZE = 65536
+
+    def __init__(self, node_url, http, page_size=1000, page_workers=4):
+        self.node_url = node_url
+        self.http = http
+        self.page_size = page_size
+        self.executor = ThreadPoolExecutor(max_workers=page_workers)
+
+        # Set to False once the node has rejected a batch request
+        self.batch_supported = True
+
+    def get_latest_momentum(self):
+        return self.__parse_latest_momentum(self.__rpc(self.__ledger_get_frontier_momentum()))
+
+    def get_all_pillars(self):
+        # Get all Pillars page by page. The first page gives the total count, the other pages are
+        # fetched concurrently. The snapshot is marked as incomplete if the pages do not add up
+        # to the count, for example if Pillars were created or dismantled between the pages.
+        first_page = self.__get_pillar_page(0)
+        if 'error' in first_page:
+            return first_page
+        count = first_page['count']
+        page_count = max(1, (count + self.page_size - 1) // self.page_size)
+        pages = [first_page] + list(self.executor.map(self.__get_pillar_page, range(1, page_count)))
+
+        pillars = {}
+        for page in pages:
+            if 'error' in page:
+                return page
+            pillars.update(page['pillars'])
+        complete = all(page['count'] == count for page in pages) and len(pillars) == count
+        if not complete:
+            print(f'Incomplete Pillar list from {self.node_url}: {len(pillars)} of {count} Pillars')
+        return {'pillars': pillars, 'complete': complete, 'timestamp': str(datetime.datetime.now())}
+
+    def get_reward_epoch(self, address):
+        return self.__parse_reward_epoch(self.__rpc(self.__embedded_pillar_get_frontier_reward_by_page(address)))
+
+    def get_poll_data(self, reward_addresses):
+        # Get the latest momentum and the reward epoch of every reward address in one round trip,
+        # while the Pillar pages are fetched
+        batch = self.executor.submit(self.rpc_batch, [self.__ledger_get_frontier_momentum()] +
+                                     [self.__embedded_pillar_get_frontier_reward_by_page(address) for address in reward_addresses])
+        pillar_data = self.get_all_pillars()
+        r = batch.result()
+        return {'latest_momentum': self.__parse_latest_momentum(r[0]),
+                'pillar_data': pillar_data,
+                'epoch_data': {address: self.__parse_reward_epoch(response)
+                               for address, response in zip(reward_addresses, r[1:])}}
+
+    def get_reward_epochs(self, addresses):
+        # Get the reward epoch of every address in one round trip
+        r = self.rpc_batch([self.__embedded_pillar_get_frontier_reward_by_page(address) for address in addresses])
+        return {address: self.__parse_reward_epoch(response) for address, response in zip(addresses, r)}
+
+    def get_reward_histories(self, requests):
+        # Get the latest rewards of every (address, count) in one round trip
+        r = self.rpc_batch([self.__embedded_pillar_get_frontier_reward_by_page(address, count) for address, count in requests])
+        return {address: self.__parse_reward_history(response) for (address, count), response in zip(requests, r)}
+
+    def get_pillar_snapshot(self):
+        # Get all Pillars together with the momentum height they were read at
+        latest_momentum = self.executor.submit(self.get_latest_momentum)
+        pillar_data = self.get_all_pillars()
+        return {'latest_momentum': latest_momentum.result(),
+                'pillar_data': pillar_data}
+
+    def rpc_batch(self, rpc_requests):
+        # Send the requests as one JSON-RPC batch and return the responses in request order.
+        # Each response is either the JSON-RPC response object or {'error': ...}.
+        # A single call is sent without a batch wrapper
+        if not self.batch_supported or len(rpc_requests) == 1:
+            return [self.__rpc(rpc_request) for rpc_request in rpc_requests]
+
+        payload = []
+        for i, rpc_request in enumerate(rpc_requests):
+            payload.append(dict(rpc_request, id=i + 1))
+
+        for rpc_request in rpc_requests:
+            metrics.inc('node_rpc_calls_total', {'node': self.node_url, 'method': rpc_request['method']})
+        try:
+            with metrics.time('node_rpc_duration_seconds', {'node': self.node_url, 'method': 'batch'}):
+                r = self.http.post(self.node_url, payload)
+        except requests.exceptions.RequestException as e:
+            metrics.inc('node_rpc_errors_total', {'node': self.node_url, 'method': 'batch'})
+            return [{'error': 'Request failed', 'detail': repr(e)} for rpc_request in rpc_requests]
+
+        # A node or proxy that does not support batches rejects them with a client error, or with a
+        # single JSON-RPC error. Fall back to sequential calls and stop batching.
+        if 400 <= r.status_code < 500 and r.status_code != 429:
+            return self.__disable_batches(rpc_requests, r.status_code)
+
+        # Other errors of the request fail every call of this poll, the batch is sent again on the next poll
+        if r.status_code != 200:
+            metrics.inc('node_rpc_errors_total', {'node': self.node_url, 'method': 'batch'})
+            return [{'error': 'Bad response', 'detail': r.status_code} for rpc_request in rpc_requests]
+        try:
+            d = json.loads(r.text)
+        except ValueError:
+            metrics.inc('node_rpc_errors_total', {'node': self.node_url, 'method': 'batch'})
+            return [{'error': 'Invalid JSON response', 'detail': ''} for rpc_request in rpc_requests]
+
+        if isinstance(d, dict) and 'error' in d:
+            return self.__disable_batches(rpc_requests, d['error'])
+
+        if not isinstance(d, list):
+            metrics.inc('node_rpc_errors_total', {'node': self.node_url, 'method': 'batch'})
+            return [{'error': 'Invalid batch response', 'detail': ''} for rpc_request in rpc_requests]
+
+        responses_by_id = {}
+        for response in d:
+            if isinstance(response, dict) and 'id' in response:
+                responses_by_id[response['id']] = response
+
+        responses = []
+        for request in payload:
+            if request['id'] in responses_by_id:
+                responses.append(responses_by_id[request['id']])
+            else:
+                responses.append(
+                    {'error': 'Missing response', 'detail': request['method']})
+        return responses
+
+    def __disable_batches(self, rpc_requests, error):
+        print(f'Node does not support JSON-RPC batches ({error}). Using sequential calls.')
+        self.batch_supported = False
+        return [self.__rpc(rpc_request) for rpc_request in rpc_requests]
+
+    def __rpc(self, rpc_request):
+        labels = {'node': self.node_url, 'method': rpc_request['method']}
+        metrics.inc('node_rpc_calls_total', labels)
+        try:
+            with metrics.time('node_rpc_duration_seconds', labels):
+                r = self.http.post(self.node_url, rpc_request)
+        except requests.exceptions.RequestException as e:
+            metrics.inc('node_rpc_errors_total', labels)
+            return {'error': 'Request failed', 'detail': repr(e)}
+        if r.status_code == 200:
+            try:
+                return json.loads(r.text)
+            except ValueError:
+                metrics.inc('node_rpc_errors_total', labels)
+                return {'error': 'Invalid JSON response', 'detail': ''}
+        else:
+            metrics.inc('node_rpc_errors_total', labels)
+            return {'error': 'Bad response', 'detail': r.status_code}
+
+    def __get_pillar_page(self, page_index):
+        # Stream the page and create the Pillars while it is received, so that neither the
+        # response text nor the parsed list is kept in memory
+        rpc_request = self.__embedded_pillar_get_all([page_index, self.page_size])
+        labels = {'node': self.node_url, 'method': rpc_request['method']}
+        metrics.inc('node_rpc_calls_total', labels)
+        pillars = {}
+        try:
+            with metrics.time('node_rpc_duration_seconds', labels):
+                r = self.http.post(self.node_url, rpc_request, stream=True)
+                try:
+                    if r.status_code != 200:
+                        metrics.inc('node_rpc_errors_total', labels)
+                        return {'error': f'Bad response: get_all_pillars {r.status_code}'}
+                    r.encoding = 'utf-8'
+                    stream = JsonArrayStream('list')
+                    for chunk in r.iter_content(self.STREAM_CHUNK_SIZE, decode_unicode=True):
+                        for item in stream.feed(chunk):
+                            pillar = Pillar.from_rpc(item)
+                            pillars[pillar.owner_address] = pillar
+                    response = stream.get_envelope()
+                finally:
+                    r.close()
+        except requests.exceptions.RequestException as e:
+            metrics.inc('node_rpc_errors_total', labels)
+            return {'error': f'Request failed: get_all_pillars {repr(e)}'}
+        except ValueError:
+            metrics.inc('node_rpc_errors_total', labels)
+            return {'error': 'Invalid JSON response: get_all_pillars'}
+        except (KeyError, TypeError):
+            return {'error': 'KeyError: get_all_pillars'}
+
+        d = self.__get_result(response, 'get_all_pillars')
+        if 'error' in d:
+            return d
+        try:
+            return {'count': d['result']['count'], 'pillars': pillars}
+        except (KeyError, TypeError):
+            return {'error': 'KeyError: get_all_pillars'}
+
+    def __get_result(self, response, name):
+        if 'result' in response:
+            return {'result': response['result']}
+        # JSON-RPC error objects and transport errors are both mapped to {'error': ...}
+        error = response.get('error')
+        if isinstance(error, dict):
+            return {'error': f'RPC error: {name} {error.get("message")}'}
+        return {'error': f'{error}: {name} {response.get("detail", "")}'.strip()}
+
+    def __parse_latest_momentum(self, response):
+        d = self.__get_result(response, 'get_latest_momentum')
+        if 'error' in d:
+            return d
+        try:
+            return {'height': d['result']['height'], 'momentumTimestamp': d['result']['timestamp'],
+                    'timestamp': str(datetime.datetime.now())}
+        except (KeyError, TypeError):
+            return {'error': 'KeyError: get_latest_momentum'}
+
+    def __parse_reward_epoch(self, response):
+        d = self.__get_result(response, 'get_reward_epoch')
+        if 'error' in d:
+            return d
+        try:
+            if len(d['result']['list']) > 0:
+                return {'epoch': d['result']['list'][0]['epoch'], 'reward': d['result']['list'][0]['znnAmount'], 'timestamp': str(datetime.datetime.now())}
+            else:
+                return {'error': f'Result list empty: get_reward_epoch'}
+        except (KeyError, TypeError):
+            return {'error': 'KeyError: get_reward_epoch'}
+
+    def __parse_reward_history(self, response):
+        d = self.__get_result(response, 'get_reward_history')
+        if 'error' in d:
+            return d
+        try:
+            return {'rewards': [{'epoch': reward['epoch'], 'znnAmount': int(reward['znnAmount']), 'qsrAmount': int(reward['qsrAmount'])}
+                                for reward in d['result']['list']]}
+        except (KeyError, TypeError, ValueError):
+            return {'error': 'KeyError: get_reward_history'}
+
+    def __ledger_get_frontier_momentum(self):
+        return {'jsonrpc': '2.0', 'id': 1,
+                'method': 'ledger.getFrontierMomentum', 'params': []}
+
+    def __embedded_pillar_get_all(self, params):
+        return {'jsonrpc': '2.0', 'id': 1,
+                'method': 'embedded.pillar.getAll', 'params': params}
+
+    def __embedded_pillar_get_frontier_reward_by_page(self, address, page_size=1):
+        return {'jsonrpc': '2.0', 'id': 1,
+                'method': 'embedded.pillar.getFrontierRewardByPage', 'params': [address, 0, page_size]}
@@ -0,0 +1,61 @@
+import asyncio
+import json
+import random
+
+import websockets
+
+
+class NodeWsWrapper(object):
+
+    def __init__(self, node_url, reconnect_delay=1, max_reconnect_delay=60, ping_interval=20, request_timeout=10):
+        self.node_url = node_url
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ping_interval = ping_interval
+        self.request_timeout = request_timeout
+
+    async def subscribe_to_momentums(self, on_momentum, on_subscribed=None):
+        # Call on_momentum for every new momentum. The connection is re-established and the
+        # subscription renewed whenever the connection is lost. on_subscribed is called after
+        # every (re)subscription so that the caller can catch up on momentums it may have missed.
+        delay = self.reconnect_delay
+        while True:
+            try:
+                async with websockets.connect(self.node_url, ping_interval=self.ping_interval) as ws:
+                    subscription_id = await self.__ledger_subscribe(ws, 'momentums')
+                    print(f'Subscribed to momentums: {subscription_id}')
+                    delay = self.reconnect_delay
+                    if on_subscribed is not None:
+                        await on_subscribed()
+
+                    async for message in ws:
+                        d = json.loads(message)
+                        if d.get('method') != 'ledger.subscription':
+                            continue
+                        params = d.get('params', {})
+                        if params.get('subscription') != subscription_id:
+                            continue
+                        for momentum in params.get('result') or []:
+                            await on_momentum(momentum)
+
+                print('Momentum subscription closed by the node')
+            except (OSError, ValueError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                print(f'Momentum subscription failed: {repr(e)}')
+
+            # Reconnect with exponential backoff and jitter
+            await asyncio.sleep(random.uniform(delay / 2, delay))
+            delay = min(self.max_reconnect_delay, delay * 2)
+
+    async def __ledger_subscribe(self, ws, topic):
+        await ws.send(json.dumps({'jsonrpc': '2.0', 'id': 1,
+                                  'method': 'ledger.subscribe', 'params': [topic]}))
+
+        # Wait for the subscription response. Notifications are not sent before it.
+        while True:
+            message = await asyncio.wait_for(ws.recv(), timeout=self.request_timeout)
+            d = json.loads(message)
+            if d.get('id') != 1:
+                continue
+            if 'result' not in d:
+                raise ValueError(f'Subscription rejected: {d.get("error")}')
+            return d['result']
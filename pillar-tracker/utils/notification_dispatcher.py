@@ -0,0 +1,219 @@
+import datetime
+import json
+import queue
+import threading
+import time
+
+from utils.metrics import metrics
+
+
+class NotificationDispatcher(object):
+    # Delay before a failed delivery is retried, doubled after every attempt up to the maximum
+    RETRY_DELAY = 1
+    MAX_RETRY_DELAY = 60
+
+    # Message length limits of the APIs
+    MAX_MESSAGE_LENGTHS = {'telegram': 4096, 'discord': 2000}
+
+    def __init__(self, telegram, discord, telegram_messages_per_minute=20, discord_messages_per_minute=30, max_attempts=5, on_delivered=None,
+                 digest_window=0, direct_messages_per_second=20):
+        self.telegram = telegram
+        self.discord = discord
+        self.min_intervals = {'telegram': 60 / telegram_messages_per_minute,
+                              'discord': 60 / discord_messages_per_minute}
+
+        # Retry failed deliveries indefinitely if max_attempts is None
+        self.max_attempts = max_attempts
+
+        # Called with the notification key once a notification has been delivered or rejected
+        self.on_delivered = on_delivered
+
+        # Seconds to wait for more notifications to the same destination to send them as one message
+        self.digest_window = digest_window
+
+        # Direct messages to subscribers share one queue, which is limited to the bot's overall rate
+        self.direct_min_interval = 1 / direct_messages_per_second
+
+        self.queues = {}
+        self.lock = threading.Lock()
+
+    def dispatch(self, notification):
+        # Notification: {'key': ..., 'sink': 'telegram' | 'discord', 'target': chat ID or webhook URL,
+        # 'message': ..., 'description': ..., 'critical': sent without waiting for a digest,
+        # 'direct': a direct message to a subscriber}
+        if notification.get('direct', False):
+            destination = (notification['sink'], None)
+        else:
+            destination = (notification['sink'], notification['target'])
+        self.__enqueue(destination, dict(notification, method='send'))
+
+    def edit_telegram(self, chat_id, message_id, message, description, on_delivered=None):
+        # on_delivered is called once the edit has been delivered or rejected
+        self.__enqueue(('telegram', chat_id), {
+                       'key': None, 'method': 'edit', 'message_id': message_id, 'message': message, 'description': description,
+                       'on_delivered': on_delivered})
+
+    def join(self):
+        # Wait until every queued notification has been delivered or given up on
+        with self.lock:
+            queues = list(self.queues.values())
+        for q in queues:
+            q.join()
+
+    def __enqueue(self, destination, item):
+        # Every destination has its own queue and worker thread. Messages to the same destination
+        # are delivered in order while different destinations are served concurrently.
+        with self.lock:
+            if destination not in self.queues:
+                self.queues[destination] = queue.Queue()
+                threading.Thread(target=self.__worker, args=(
+                    destination, self.queues[destination]), daemon=True).start()
+            self.queues[destination].put(item)
+
+    def __worker(self, destination, q):
+        next_send_time = 0
+        while True:
+            items = [q.get()]
+
+            # Wait for more notifications to send them as one digest. Edits and critical
+            # notifications are not delayed.
+            if self.__can_coalesce(items[0]):
+                deadline = time.monotonic() + self.digest_window
+                while True:
+                    try:
+                        item = q.get(timeout=max(0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    items.append(item)
+                    if not self.__can_coalesce(item):
+                        break
+
+            for item in self.__create_digests(destination, items):
+                next_send_time = self.__send(destination, item, next_send_time)
+            for item in items:
+                q.task_done()
+
+    def __send(self, destination, item, next_send_time):
+        # Deliver with retries. Returns the earliest time of the next delivery to the destination.
+        sink = destination[0]
+        min_interval = self.min_intervals[sink] if destination[1] is not None else self.direct_min_interval
+        attempt = 0
+        while True:
+            # Stay under the per-destination rate limit
+            time.sleep(max(0, next_send_time - time.monotonic()))
+            next_send_time = time.monotonic() + min_interval
+            attempt = attempt + 1
+            gave_up = self.max_attempts is not None and attempt >= self.max_attempts
+
+            try:
+                with metrics.time('notification_duration_seconds', {'sink': sink}):
+                    r = self.__deliver(destination, item)
+            except Exception as e:
+                r = None
+                error = repr(e)
+
+            # Wait as long as the API asks for if the rate limit has been exceeded
+            if r is not None and r.status_code == 429 and not gave_up:
+                retry_after = self.__get_retry_after(r)
+                metrics.inc('notifications_rate_limited_total', {'sink': sink})
+                print(
+                    f'{str(datetime.datetime.now())}: Rate limited by {sink.capitalize()}, retrying in {retry_after}s')
+                next_send_time = time.monotonic() + retry_after
+                continue
+
+            # Client errors other than rate limits will not succeed on a retry. A message that is still
+            # rate limited on the last attempt is not acked and stays pending in the outbox.
+            if r is not None and r.status_code < 500 and r.status_code != 429:
+                print(
+                    f'{item["description"]} sent to {sink.capitalize()}: {r.status_code}')
+                metrics.inc('notifications_sent_total', {'sink': sink, 'status': r.status_code})
+                if self.on_delivered is not None:
+                    for key in item.get('keys', [item['key']]):
+                        if key is not None:
+                            self.on_delivered(key)
+                if item.get('on_delivered') is not None:
+                    item['on_delivered']()
+                return next_send_time
+
+            if r is not None:
+                error = r.status_code
+            metrics.inc('notification_failures_total', {'sink': sink})
+            if gave_up:
+                print(
+                    f'{item["description"]} could not be sent to {sink.capitalize()}: {error}')
+                metrics.inc('notifications_dropped_total', {'sink': sink})
+                return next_send_time
+            time.sleep(
+                min(self.MAX_RETRY_DELAY, self.RETRY_DELAY * (2 ** (attempt - 1))))
+
+    def __can_coalesce(self, item):
+        return self.digest_window > 0 and item['method'] == 'send' and not item.get('critical', False)
+
+    def __create_digests(self, destination, items):
+        # The direct message queue holds messages to many chats. Combine the messages per chat.
+        if destination[1] is None:
+            targets = {}
+            for item in items:
+                targets.setdefault(item['target'], []).append(item)
+            return [digest for target_items in targets.values()
+                    for digest in self.__create_target_digests(destination[0], target_items)]
+        return self.__create_target_digests(destination[0], items)
+
+    def __create_target_digests(self, sink, items):
+        # Join consecutive notifications into messages of at most the sink's message length
+        digests = []
+        group = []
+        for item in items + [None]:
+            if item is not None and self.__can_coalesce(item):
+                if len(group) > 0 and self.__get_length(sink, '\n\n'.join(
+                        [i['message'] for i in group] + [item['message']])) > self.MAX_MESSAGE_LENGTHS[sink]:
+                    digests.append(self.__create_digest(group))
+                    group = []
+                group.append(item)
+                continue
+            if len(group) > 0:
+                digests.append(self.__create_digest(group))
+                group = []
+            if item is not None:
+                digests.append(item)
+        return digests
+
+    def __create_digest(self, items):
+        if len(items) == 1:
+            return items[0]
+        metrics.inc('notifications_coalesced_total', value=len(items))
+        return {'key': None, 'keys': [item['key'] for item in items], 'method': 'send', 'target': items[0]['target'],
+                'message': '\n\n'.join(item['message'] for item in items),
+                'description': f'Digest of {len(items)} notifications'}
+
+    def __get_length(self, sink, message):
+        # Telegram counts UTF-16 code units
+        if sink == 'telegram':
+            return len(message.encode('utf-16-le')) // 2
+        return len(message)
+
+    def __deliver(self, destination, item):
+        sink, target = destination
+        if target is None:
+            target = item['target']
+        if sink == 'telegram':
+            if item['method'] == 'edit':
+                return self.telegram.bot_edit_message(
+                    chat_id=target, message_id=item['message_id'], message=item['message'])
+            return self.telegram.bot_send_message_to_chat(target, item['message'])
+        return self.discord.webhook_send_message_to_channel(target, item['message'])
+
+    def __get_retry_after(self, r):
+        # Telegram: {"parameters": {"retry_after": seconds}}, Discord: {"retry_after": seconds}
+        try:
+            d = json.loads(r.text)
+            if 'parameters' in d and 'retry_after' in d['parameters']:
+                return float(d['parameters']['retry_after'])
+            if 'retry_after' in d:
+                return float(d['retry_after'])
+        except (ValueError, TypeError):
+            pass
+        try:
+            return float(r.headers.get('Retry-After', self.RETRY_DELAY))
+        except ValueError:
+            return self.RETRY_DELAY
@@ -0,0 +1,97 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class Outbox(object):
+    # Compact the file once it holds this many lines more than a compacted file would
+    COMPACT_THRESHOLD = 1000
+
+    def __init__(self, file_path, max_acked_keys=10000):
+        self.file_path = file_path
+        self.max_acked_keys = max_acked_keys
+        self.pending = OrderedDict()
+        self.acked = OrderedDict()
+        self.lines = 0
+        self.lock = threading.Lock()
+        self.__load()
+        self.__compact()
+
+    def append(self, notifications):
+        # Durably store the notifications and return the ones that were not queued before.
+        # A notification is identified by its key, so detecting the same event again is a no-op.
+        with self.lock:
+            added = []
+            for n in notifications:
+                if n['key'] in self.pending or n['key'] in self.acked:
+                    continue
+                self.pending[n['key']] = n
+                added.append(n)
+            if len(added) > 0:
+                self.__write([{'op': 'add', 'notification': n} for n in added])
+            return added
+
+    def ack(self, key):
+        # Mark the notification as delivered. Its key is remembered to prevent duplicates.
+        with self.lock:
+            if key not in self.pending:
+                return
+            self.__write([{'op': 'ack', 'key': key}])
+            del self.pending[key]
+            self.__remember_acked(key)
+            if self.lines - len(self.pending) - len(self.acked) > self.COMPACT_THRESHOLD:
+                self.__compact()
+
+    def get_pending(self):
+        with self.lock:
+            return list(self.pending.values())
+
+    def __remember_acked(self, key):
+        self.acked[key] = None
+        while len(self.acked) > self.max_acked_keys:
+            self.acked.popitem(last=False)
+
+    def __write(self, entries):
+        with open(self.file_path, 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.lines = self.lines + len(entries)
+
+    def __load(self):
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A crash can leave a partially written last line
+                    continue
+                if entry['op'] == 'add':
+                    key = entry['notification']['key']
+                    if key not in self.acked:
+                        self.pending[key] = entry['notification']
+                elif entry['op'] == 'ack':
+                    self.pending.pop(entry['key'], None)
+                    self.__remember_acked(entry['key'])
+
+    def __compact(self):
+        # Rewrite the file with only the pending notifications and the remembered keys.
+        # The new file replaces the old one atomically.
+        entries = []
+        for key in self.acked:
+            entries.append({'op': 'ack', 'key': key})
+        for n in self.pending.values():
+            entries.append({'op': 'add', 'notification': n})
+
+        tmp_file_path = f'{self.file_path}.tmp'
+        with open(tmp_file_path, 'w') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file_path, self.file_path)
+        self.lines = len(entries)
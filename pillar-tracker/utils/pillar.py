@@ -0,0 +1,68 @@
+class Pillar(object):
+    __slots__ = ('owner_address', 'name', 'weight', 'produced_momentums', 'expected_momentums',
+                 'give_momentum_reward_percentage', 'give_delegate_reward_percentage', 'rank')
+
+    def __init__(self, owner_address, name, weight, produced_momentums, expected_momentums,
+                 give_momentum_reward_percentage, give_delegate_reward_percentage, rank):
+        self.owner_address = owner_address
+        self.name = name
+        self.weight = weight
+        self.produced_momentums = produced_momentums
+        self.expected_momentums = expected_momentums
+        self.give_momentum_reward_percentage = give_momentum_reward_percentage
+        self.give_delegate_reward_percentage = give_delegate_reward_percentage
+        self.rank = rank
+
+    @classmethod
+    def from_rpc(cls, pillar):
+        # Create from an item of the embedded.pillar.getAll result list or from to_dict()
+        stats = pillar['currentStats']
+        return cls(pillar['ownerAddress'], pillar['name'], pillar['weight'],
+                   stats['producedMomentums'], stats['expectedMomentums'],
+                   pillar['giveMomentumRewardPercentage'], pillar['giveDelegateRewardPercentage'], pillar['rank'])
+
+    @classmethod
+    def from_list(cls, values):
+        return cls(*values)
+
+    def to_list(self):
+        # Compact serialization, the values in slot order
+        return [self.owner_address, self.name, self.weight, self.produced_momentums, self.expected_momentums,
+                self.give_momentum_reward_percentage, self.give_delegate_reward_percentage, self.rank]
+
+    def to_dict(self):
+        return {'name': self.name, 'ownerAddress': self.owner_address,
+                'currentStats': {'producedMomentums': self.produced_momentums, 'expectedMomentums': self.expected_momentums},
+                'weight': self.weight, 'giveMomentumRewardPercentage': self.give_momentum_reward_percentage,
+                'giveDelegateRewardPercentage': self.give_delegate_reward_percentage, 'rank': self.rank}
+
+    def __reduce__(self):
+        # Pickle the values in slot order, used to pass Pillars between processes
+        return (self.__class__, tuple(self.to_list()))
+
+    def get_tracked_values(self):
+        # Values compared between snapshots: name, momentum reward %, delegate reward %,
+        # produced momentums and expected momentums
+        return (self.name, self.give_momentum_reward_percentage, self.give_delegate_reward_percentage,
+                self.produced_momentums, self.expected_momentums)
+
+    def __eq__(self, other):
+        if not isinstance(other, Pillar):
+            return NotImplemented
+        return self.to_list() == other.to_list()
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f'Pillar({self.name}, {self.owner_address})'
+
+
+def pillars_to_lists(pillars):
+    return [pillar.to_list() for pillar in pillars.values()]
+
+
+def pillars_from_lists(values):
+    pillars = {}
+    for v in values:
+        pillars[v[0]] = Pillar.from_list(v)
+    return pillars
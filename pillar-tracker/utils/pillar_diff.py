@@ -0,0 +1,56 @@
+from collections import namedtuple
+
+# old and new are the cached and the new Pillar data, None if the Pillar does not exist in one of them
+PillarEvent = namedtuple('PillarEvent', ['type', 'owner_address', 'old', 'new'])
+
+PILLAR_DISMANTLED = 'dismantled'
+PILLAR_CREATED = 'created'
+PILLAR_NAME_CHANGED = 'name_changed'
+PILLAR_REWARD_SHARE_CHANGED = 'reward_share_changed'
+PILLAR_STATS_CHANGED = 'stats_changed'
+
+# Events are returned grouped by type in this order
+EVENT_ORDER = (PILLAR_DISMANTLED, PILLAR_CREATED, PILLAR_NAME_CHANGED,
+               PILLAR_REWARD_SHARE_CHANGED, PILLAR_STATS_CHANGED)
+
+
+def diff_pillars(cached_pillars, new_pillars):
+    # Compare two snapshots keyed by owner address and return the differences as a list of events
+    events = {event_type: [] for event_type in EVENT_ORDER}
+
+    # Assume a Pillar is dismantled if the owner address is no longer present in the new data.
+    # Ignore an empty or grown snapshot, a Pillar cannot be dismantled then.
+    if 0 < len(new_pillars) < len(cached_pillars):
+        for owner_address in [a for a in cached_pillars if a not in new_pillars]:
+            events[PILLAR_DISMANTLED].append(PillarEvent(
+                PILLAR_DISMANTLED, owner_address, cached_pillars[owner_address], None))
+
+    # Assume a Pillar is new if the owner address was not present in the cached data
+    if len(new_pillars) > len(cached_pillars):
+        for owner_address in [a for a in new_pillars if a not in cached_pillars]:
+            events[PILLAR_CREATED].append(PillarEvent(
+                PILLAR_CREATED, owner_address, None, new_pillars[owner_address]))
+
+    # Compare all tracked values of a Pillar at once and only look at the single values
+    # for the Pillars that have changed
+    common_addresses = [a for a in new_pillars if a in cached_pillars]
+    old_values = [cached_pillars[a].get_tracked_values() for a in common_addresses]
+    new_values = [new_pillars[a].get_tracked_values() for a in common_addresses]
+    for owner_address, old, new in zip(common_addresses, old_values, new_values):
+        if old == new:
+            continue
+        event_args = (owner_address, cached_pillars[owner_address], new_pillars[owner_address])
+        if old[0] != new[0]:
+            events[PILLAR_NAME_CHANGED].append(
+                PillarEvent(PILLAR_NAME_CHANGED, *event_args))
+        if old[1:3] != new[1:3]:
+            events[PILLAR_REWARD_SHARE_CHANGED].append(
+                PillarEvent(PILLAR_REWARD_SHARE_CHANGED, *event_args))
+        if old[3:] != new[3:]:
+            events[PILLAR_STATS_CHANGED].append(
+                PillarEvent(PILLAR_STATS_CHANGED, *event_args))
+
+    result = []
+    for event_type in EVENT_ORDER:
+        result.extend(events[event_type])
+    return result
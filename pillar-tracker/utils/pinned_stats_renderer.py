@@ -0,0 +1,78 @@
+import datetime
+
+
+class PinnedStatsRenderer(object):
+    # Telegram's message length limit, counted in UTF-16 code units
+    MAX_MESSAGE_LENGTH = 4096
+
+    def __init__(self):
+        # Rendered row and the values it was rendered from per Pillar
+        self.rows = {}
+
+    def render(self, pillars, momentum_height, aprs=None, ranking=None):
+        # Returns the message and its rows. Only rows of Pillars whose values have changed are rendered again.
+        # The APR of every Pillar is shown if aprs is given. With a ranking index only the Pillars
+        # that fit in the message are read from the index instead of sorting all Pillars.
+        if ranking is not None:
+            ranked_pillars = ranking.iter_ranked()
+        else:
+            ranked_pillars = sorted(pillars.values(), key=lambda pillar: pillar.rank)
+
+        # Reserve space for the longest possible header
+        budget = self.MAX_MESSAGE_LENGTH - \
+            self.__get_length(self.__create_header(len(pillars), True, momentum_height, aprs is not None))
+
+        rows = []
+        length = 0
+        for rank, pillar in enumerate(ranked_pillars):
+            row = self.__get_row(pillar, rank if ranking is not None else pillar.rank, aprs)
+            row_length = self.__get_length(row)
+            if length + row_length > budget:
+                break
+            rows.append(row)
+            length = length + row_length
+
+        # Forget Pillars that no longer exist
+        if len(self.rows) > len(pillars):
+            for owner_address in [a for a in self.rows if a not in pillars]:
+                del self.rows[owner_address]
+
+        body = ''.join(rows)
+        header = self.__create_header(len(rows), len(rows) < len(pillars), momentum_height, aprs is not None)
+        return {'message': header + body, 'body': body}
+
+    def __get_row(self, pillar, rank, aprs):
+        apr = aprs.get(pillar.owner_address, '-') if aprs is not None else None
+        values = (rank, pillar.name, pillar.give_momentum_reward_percentage, pillar.give_delegate_reward_percentage,
+                  pillar.weight, pillar.produced_momentums, pillar.expected_momentums, apr)
+        cached = self.rows.get(pillar.owner_address)
+        if cached is not None and cached[0] == values:
+            return cached[1]
+
+        weight = int(round(pillar.weight / 100000000))
+        row = ''.join([str(rank + 1), ' - ', str(pillar.name),
+                       ' -> M: ', str(pillar.give_momentum_reward_percentage),
+                       '% D: ', str(pillar.give_delegate_reward_percentage),
+                       '% ' if apr is None else f'% APR: {apr}% ',
+                       'W: ', str(weight),
+                       ' P/E: ', str(pillar.produced_momentums), '/', str(pillar.expected_momentums), '\n'])
+        self.rows[pillar.owner_address] = (values, row)
+        return row
+
+    def __create_header(self, row_count, is_truncated, momentum_height, has_aprs):
+        if is_truncated:
+            title = f'Pillar reward sharing rates (top {row_count})\n'
+        else:
+            title = 'Pillar reward sharing rates\n'
+        return ''.join([title,
+                        'Last updated: ', datetime.datetime.now(datetime.timezone.utc).strftime(
+                            '%Y-%m-%d %H:%M:%S'), ' (UTC)\n',
+                        'Momentum height: ', str(momentum_height), '\n',
+                        'M = momentum reward sharing %\n',
+                        'D = delegate reward sharing %\n',
+                        'APR = annualized pillar rewards / weight\n' if has_aprs else '',
+                        'W = pillar weight (ZNN) \n',
+                        'P/E = produced/expected momentums\n\n'])
+
+    def __get_length(self, text):
+        return len(text.encode('utf-16-le')) // 2
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+class QueryApi(object):
+    # Read-only views of the tracked Pillar data. Responses are rendered once per snapshot and
+    # served with an ETag, so that repeated reads cost neither node requests nor serialization.
+    #
+    # GET /pillars                       all Pillars with their momentum status
+    # GET /pillars/<address>             a single Pillar
+    # GET /pillars/<address>/history     stats history of a Pillar, optionally ?from=<height>&to=<height>
+    # GET /rankings                      Pillars ordered by rank
+    # GET /events                        recently notified events
+    #
+    # Profiles other than the default profile are served under /<profile name>/...
+
+    def __init__(self, max_events=100):
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.snapshots = {}
+        self.histories = {}
+        self.events = {}
+
+    def add_profile(self, profile, history):
+        with self.lock:
+            self.histories[profile] = history
+            self.events[profile] = deque(maxlen=self.max_events)
+
+    def update(self, profile, momentum_height, pillars, momentum_status, events):
+        # Replace the snapshot of a profile. Readers keep using the previous snapshot until the
+        # new one is complete.
+        now = int(time.time())
+        with self.lock:
+            for event in events:
+                self.events[profile].appendleft(dict(event, height=momentum_height, timestamp=now))
+            recent_events = list(self.events[profile])
+
+        pillar_views = {}
+        for owner_address, pillar in pillars.items():
+            view = pillar.to_dict()
+            status = momentum_status.get(owner_address) if momentum_status is not None else None
+            if status is not None:
+                view['isProducing'] = status['isProducing']
+                view['missedMomentums'] = status['missedMomentums']
+            pillar_views[owner_address] = view
+        ranked = sorted(pillar_views.values(), key=lambda view: view['rank'])
+
+        snapshot = {'height': momentum_height, 'pillars': pillar_views, 'responses': {}, 'lock': threading.Lock()}
+        snapshot['responses']['/pillars'] = self.__create_response(
+            {'height': momentum_height, 'count': len(ranked), 'pillars': ranked})
+        snapshot['responses']['/rankings'] = self.__create_response(
+            {'height': momentum_height, 'rankings': [{'rank': view['rank'], 'name': view['name'], 'ownerAddress': view['ownerAddress'],
+                                                      'weight': view['weight']} for view in ranked]})
+        snapshot['responses']['/events'] = self.__create_response(
+            {'height': momentum_height, 'events': recent_events})
+        with self.lock:
+            self.snapshots[profile] = snapshot
+
+    def handle(self, path, if_none_match=None):
+        # Returns the status code, the ETag and the body of the response
+        u = urlsplit(path)
+        parts = [part for part in u.path.split('/') if len(part) > 0]
+        with self.lock:
+            if len(parts) > 0 and parts[0] in self.snapshots:
+                profile = parts[0]
+                parts = parts[1:]
+            else:
+                profile = ''
+            snapshot = self.snapshots.get(profile)
+            history = self.histories.get(profile)
+        if snapshot is None:
+            return 503, None, self.__encode({'error': 'No data yet'})
+
+        route = '/' + '/'.join(parts)
+        response = snapshot['responses'].get(route)
+        if response is None:
+            response = self.__create_lazy_response(snapshot, history, parts, parse_qs(u.query))
+        if response is None:
+            return 404, None, self.__encode({'error': 'Not found'})
+
+        etag, body = response
+        if if_none_match is not None and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            return 304, etag, b''
+        return 200, etag, body
+
+    def __create_lazy_response(self, snapshot, history, parts, query):
+        # Single Pillar views are rendered on the first request and kept for the rest of the snapshot
+        if len(parts) < 2 or parts[0] != 'pillars' or parts[1] not in snapshot['pillars']:
+            return None
+        owner_address = parts[1]
+
+        if len(parts) == 2:
+            key = f'/pillars/{owner_address}'
+            with snapshot['lock']:
+                if key not in snapshot['responses']:
+                    snapshot['responses'][key] = self.__create_response(
+                        {'height': snapshot['height'], 'pillar': snapshot['pillars'][owner_address]})
+                return snapshot['responses'][key]
+
+        if len(parts) == 3 and parts[2] == 'history' and history is not None:
+            try:
+                from_height = int(query.get('from', ['0'])[0])
+                to_height = int(query['to'][0]) if 'to' in query else None
+            except ValueError:
+                return None
+            key = f'/pillars/{owner_address}/history?{from_height}&{to_height}'
+            with snapshot['lock']:
+                if key not in snapshot['responses']:
+                    records = history.get_pillar_history(owner_address, from_height, to_height)
+                    snapshot['responses'][key] = self.__create_response(
+                        {'height': snapshot['height'], 'ownerAddress': owner_address, 'history': records})
+                return snapshot['responses'][key]
+        return None
+
+    def __create_response(self, d):
+        body = self.__encode(d)
+        return f'"{hashlib.sha1(body).hexdigest()}"', body
+
+    def __encode(self, d):
+        return json.dumps(d, separators=(',', ':')).encode()
+
+
+class QueryApiServer(object):
+
+    def __init__(self, api, host='127.0.0.1', port=8080):
+        self.api = api
+        self.server = ThreadingHTTPServer((host, port), self.__create_handler())
+        self.server.daemon_threads = True
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __create_handler(self):
+        api = self.api
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                status_code, etag, body = api.handle(self.path, self.headers.get('If-None-Match'))
+                self.send_response(status_code)
+                if etag is not None:
+                    self.send_header('ETag', etag)
+                    self.send_header('Cache-Control', 'no-cache')
+                if status_code != 304:
+                    self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
@@ -0,0 +1,137 @@
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+# pillar is the new Pillar data. value is the rank threshold, the weight change in percent or the
+# new rank. other is the list of overtaken Pillars, highest ranked first.
+RankingEvent = namedtuple('RankingEvent', ['type', 'owner_address', 'pillar', 'value', 'other'])
+
+RANK_ENTERED = 'rank_entered'
+RANK_EXITED = 'rank_exited'
+RANK_OVERTAKE = 'rank_overtake'
+WEIGHT_CHANGED = 'weight_changed'
+
+
+class RankingIndex(object):
+    # Pillars sorted by weight, updated from the changes between snapshots. Only Pillars whose
+    # weight has changed are moved, the index is never sorted again.
+    #
+    # Events:
+    # RANK_ENTERED / RANK_EXITED    a Pillar entered or left the top N for each N in rank_thresholds
+    # RANK_OVERTAKE                 a Pillar moved past other Pillars within the top overtake_top
+    # WEIGHT_CHANGED                the weight of a Pillar changed by at least weight_change_threshold %
+
+    def __init__(self, rank_thresholds=(), weight_change_threshold=0, overtake_top=0):
+        self.rank_thresholds = sorted(rank_thresholds)
+        self.weight_change_threshold = weight_change_threshold
+        self.overtake_top = overtake_top
+
+        # Sorted (-weight, owner address) keys and the Pillars by owner address
+        self.keys = []
+        self.pillars = {}
+
+    def is_empty(self):
+        return len(self.pillars) == 0
+
+    def update(self, pillars):
+        # Apply a new snapshot and return the ranking events. The first snapshot only builds the index.
+        if len(pillars) == 0:
+            return []
+        if self.is_empty():
+            self.pillars = dict(pillars)
+            self.keys = sorted(self.__get_key(pillar) for pillar in pillars.values())
+            return []
+
+        watched_top = max(self.rank_thresholds + [self.overtake_top])
+        old_top = self.get_top(watched_top)
+
+        events = []
+        cached_count = len(self.pillars)
+        seen = 0
+        for owner_address, pillar in pillars.items():
+            cached = self.pillars.get(owner_address)
+            if cached is None:
+                insort(self.keys, self.__get_key(pillar))
+            else:
+                seen = seen + 1
+                if cached.weight != pillar.weight:
+                    self.__remove_key(cached)
+                    insort(self.keys, self.__get_key(pillar))
+                    if self.weight_change_threshold > 0 and cached.weight > 0:
+                        change = (pillar.weight - cached.weight) / cached.weight * 100
+                        if abs(change) >= self.weight_change_threshold:
+                            events.append(RankingEvent(WEIGHT_CHANGED, owner_address, pillar, round(change, 1), None))
+            self.pillars[owner_address] = pillar
+
+        # Remove the Pillars that are not in the snapshot
+        if seen < cached_count:
+            for owner_address in [a for a in self.pillars if a not in pillars]:
+                self.__remove_key(self.pillars.pop(owner_address))
+
+        new_top = self.get_top(watched_top)
+        events.extend(self.__get_threshold_events(old_top, new_top))
+        events.extend(self.__get_overtake_events(old_top, new_top))
+        return events
+
+    def get_rank(self, owner_address):
+        # Zero-based position by weight
+        pillar = self.pillars.get(owner_address)
+        if pillar is None:
+            return None
+        return bisect_left(self.keys, self.__get_key(pillar))
+
+    def get_range(self, start, stop):
+        # Pillars from rank start up to rank stop, heaviest first
+        return [self.pillars[key[1]] for key in self.keys[start:stop]]
+
+    def get_top(self, count):
+        return self.get_range(0, count)
+
+    def iter_ranked(self):
+        for key in self.keys:
+            yield self.pillars[key[1]]
+
+    def __get_threshold_events(self, old_top, new_top):
+        events = []
+        for threshold in self.rank_thresholds:
+            old = set(pillar.owner_address for pillar in old_top[:threshold])
+            new = {pillar.owner_address: pillar for pillar in new_top[:threshold]}
+            for owner_address, pillar in new.items():
+                if owner_address not in old:
+                    events.append(RankingEvent(RANK_ENTERED, owner_address, pillar, threshold, None))
+            for owner_address in old:
+                # Pillars that have been dismantled have not left the top N by rank
+                if owner_address not in new and owner_address in self.pillars:
+                    events.append(RankingEvent(RANK_EXITED, owner_address, self.pillars[owner_address], threshold, None))
+        return events
+
+    def __get_overtake_events(self, old_top, new_top):
+        # A Pillar overtook another Pillar if it is ranked above it now and was ranked below it before.
+        # All Pillars overtaken in one move are reported in one event.
+        events = []
+        if self.overtake_top <= 0:
+            return events
+        old_ranks = {pillar.owner_address: rank for rank, pillar in enumerate(old_top[:self.overtake_top])}
+        new_ranks = {pillar.owner_address: rank for rank, pillar in enumerate(new_top[:self.overtake_top])}
+        for owner_address, new_rank in new_ranks.items():
+            old_rank = old_ranks.get(owner_address, self.overtake_top)
+            if new_rank >= old_rank:
+                continue
+            overtaken = []
+            for other_address, other_old_rank in old_ranks.items():
+                if other_address not in self.pillars:
+                    continue
+                if new_rank <= other_old_rank < old_rank and new_ranks.get(other_address, self.overtake_top) > new_rank:
+                    overtaken.append(self.pillars[other_address])
+            if len(overtaken) > 0:
+                events.append(RankingEvent(RANK_OVERTAKE, owner_address, self.pillars[owner_address], new_rank,
+                                           overtaken))
+        return events
+
+    def __remove_key(self, pillar):
+        key = self.__get_key(pillar)
+        i = bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def __get_key(self, pillar):
+        return (-pillar.weight, pillar.owner_address)
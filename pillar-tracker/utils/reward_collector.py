@@ -0,0 +1,113 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import metrics
+
+
+class RewardCollector(object):
+    # Collects the reward history of every Pillar. Only the epochs that are not cached yet are
+    # requested, in batches that are sent concurrently at most requests_per_second times per
+    # second. The history of the last history_epochs epochs is kept in the state store.
+
+    def __init__(self, node, store, max_workers=4, requests_per_second=5, batch_size=25, history_epochs=30,
+                 apr_epochs=7, epoch_length=86400):
+        self.node = node
+        self.store = store
+        self.requests_per_second = requests_per_second
+        self.batch_size = batch_size
+        self.history_epochs = history_epochs
+        self.apr_epochs = apr_epochs
+        self.epochs_per_year = 365 * 86400 / epoch_length
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.lock = threading.Lock()
+        self.next_request_time = 0
+
+        # Rewards per Pillar by epoch: (ZNN amount, QSR amount)
+        self.rewards = store.load_rewards()
+
+        # Latest epoch that has been requested per Pillar, including Pillars without rewards. Kept in
+        # the state store so that Pillars without rewards are not requested again on every run.
+        self.checked_epochs = store.get_value('reward_checked_epochs', {})
+
+        # Average ZNN reward per epoch of the last apr_epochs epochs per Pillar
+        self.average_rewards = {}
+        self.epoch = None
+
+    def collect(self, pillars, epoch):
+        # Get the rewards up to epoch that are not cached yet. Returns the number of new rewards.
+        checked_epochs = dict(self.checked_epochs)
+        requests = []
+        for owner_address in pillars:
+            if self.checked_epochs.get(owner_address, -1) >= epoch:
+                continue
+            cached = self.rewards.get(owner_address)
+            last_epoch = max(cached) if cached else epoch - self.history_epochs
+            if last_epoch >= epoch:
+                self.checked_epochs[owner_address] = epoch
+                continue
+            requests.append((owner_address, min(epoch - last_epoch, self.history_epochs)))
+
+        rows = []
+        if len(requests) > 0:
+            batches = [requests[i:i + self.batch_size] for i in range(0, len(requests), self.batch_size)]
+            for batch, r in zip(batches, self.executor.map(self.__get_reward_histories, batches)):
+                for owner_address, count in batch:
+                    # Pillars that failed are requested again on the next run
+                    if 'error' in r[owner_address]:
+                        continue
+                    cached = self.rewards.setdefault(owner_address, {})
+                    for reward in r[owner_address]['rewards']:
+                        if reward['epoch'] <= epoch and reward['epoch'] not in cached:
+                            cached[reward['epoch']] = (reward['znnAmount'], reward['qsrAmount'])
+                            rows.append((owner_address, reward['epoch'], reward['znnAmount'], reward['qsrAmount']))
+                    self.checked_epochs[owner_address] = epoch
+            metrics.inc('reward_history_rewards_total', value=len(rows))
+
+        # Forget the Pillars that have been dismantled
+        for owner_address in [a for a in self.checked_epochs if a not in pillars]:
+            del self.checked_epochs[owner_address]
+        if self.checked_epochs != checked_epochs:
+            self.store.set_value('reward_checked_epochs', self.checked_epochs)
+
+        if len(rows) > 0 or epoch != self.epoch:
+            min_epoch = epoch - self.history_epochs + 1
+            for owner_address in list(self.rewards):
+                cached = self.rewards[owner_address]
+                for old_epoch in [e for e in cached if e < min_epoch]:
+                    del cached[old_epoch]
+                if len(cached) == 0:
+                    del self.rewards[owner_address]
+            self.store.save_rewards(rows, min_epoch)
+            self.__update_average_rewards(epoch)
+            self.epoch = epoch
+        return len(rows)
+
+    def get_rewards(self, owner_address):
+        return dict(self.rewards.get(owner_address, {}))
+
+    def get_aprs(self, pillars):
+        # APR in percent of every Pillar with rewards: the average reward per epoch, annualized and
+        # divided by the Pillar weight. Computed from aligned weight and reward lists.
+        owner_addresses = [owner_address for owner_address in pillars if owner_address in self.average_rewards]
+        weights = [pillars[owner_address].weight for owner_address in owner_addresses]
+        rewards = [self.average_rewards[owner_address] for owner_address in owner_addresses]
+        return {owner_address: round(reward * self.epochs_per_year / weight * 100, 1)
+                for owner_address, weight, reward in zip(owner_addresses, weights, rewards) if weight > 0}
+
+    def __get_reward_histories(self, batch):
+        # Space the requests of all workers to requests_per_second
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time)
+            self.next_request_time = request_time + 1 / self.requests_per_second
+        time.sleep(request_time - now)
+        metrics.inc('reward_history_requests_total')
+        return self.node.get_reward_histories(batch)
+
+    def __update_average_rewards(self, epoch):
+        self.average_rewards = {}
+        for owner_address, cached in self.rewards.items():
+            amounts = [cached[e][0] for e in range(epoch - self.apr_epochs + 1, epoch + 1) if e in cached]
+            if len(amounts) > 0:
+                self.average_rewards[owner_address] = sum(amounts) / len(amounts)
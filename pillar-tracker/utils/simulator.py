@@ -0,0 +1,274 @@
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+
+
+class NetworkSimulator(object):
+    # A simulated network of Pillars. Momentums are assigned to the Pillars in turn. Pillars that
+    # are offline miss their momentums. One momentum is produced every 10 seconds from the genesis
+    # timestamp, so epochs end after momentums_per_epoch momentums.
+    GENESIS_TIMESTAMP = 1637755200
+
+    def __init__(self, pillar_count=100, momentums_per_epoch=8640, seed=None):
+        self.random = random.Random(seed)
+        self.momentums_per_epoch = momentums_per_epoch
+        self.lock = threading.Lock()
+        # Start in the second epoch so that the rewards of the first epoch are available
+        self.height = momentums_per_epoch + 1
+        self.epoch = 1
+        self.next_id = 0
+        self.pillars = []
+        self.offline = set()
+        for i in range(pillar_count):
+            self.pillars.append(self.__create_pillar())
+        self.__update_ranks()
+
+    def advance(self, momentums=1):
+        with self.lock:
+            for i in range(momentums):
+                self.height = self.height + 1
+                if len(self.pillars) > 0:
+                    pillar = self.pillars[self.height % len(self.pillars)]
+                    pillar['currentStats']['expectedMomentums'] += 1
+                    if pillar['ownerAddress'] not in self.offline:
+                        pillar['currentStats']['producedMomentums'] += 1
+                if self.height % self.momentums_per_epoch == 0:
+                    self.__rollover_epoch()
+
+    def apply(self, step):
+        # Apply a scripted step, for example {"momentums": 10, "rename": 2, "outage": 0.3}
+        if step.get('epoch'):
+            self.advance(self.momentums_per_epoch - self.height % self.momentums_per_epoch)
+        if 'outage' in step:
+            self.start_outage(step['outage'])
+        if step.get('recover'):
+            self.end_outage()
+        self.rename(step.get('rename', 0))
+        self.change_reward_share(step.get('reward_share', 0))
+        self.create(step.get('create', 0))
+        self.dismantle(step.get('dismantle', 0))
+        self.advance(step.get('momentums', 0))
+
+    def apply_random(self, rates):
+        # Apply random events. rates is the probability of each event per call.
+        step = {}
+        for event in ('rename', 'reward_share', 'create', 'dismantle', 'epoch', 'recover'):
+            if self.random.random() < rates.get(event, 0):
+                step[event] = 1
+        if self.random.random() < rates.get('outage', 0):
+            step['outage'] = rates.get('outage_fraction', 0.1)
+        step['momentums'] = rates.get('momentums', 1)
+        self.apply(step)
+        return step
+
+    def rename(self, count):
+        with self.lock:
+            for pillar in self.random.sample(self.pillars, min(count, len(self.pillars))):
+                pillar['name'] = f'{pillar["name"].split("-")[0]}-{self.height}'
+
+    def change_reward_share(self, count):
+        with self.lock:
+            for pillar in self.random.sample(self.pillars, min(count, len(self.pillars))):
+                pillar['giveMomentumRewardPercentage'] = self.random.randrange(0, 101, 5)
+                pillar['giveDelegateRewardPercentage'] = self.random.randrange(0, 101, 5)
+
+    def create(self, count):
+        with self.lock:
+            for i in range(count):
+                self.pillars.append(self.__create_pillar())
+            if count > 0:
+                self.__update_ranks()
+
+    def dismantle(self, count):
+        with self.lock:
+            for pillar in self.random.sample(self.pillars, min(count, len(self.pillars))):
+                self.pillars.remove(pillar)
+                self.offline.discard(pillar['ownerAddress'])
+            if count > 0:
+                self.__update_ranks()
+
+    def start_outage(self, fraction):
+        # Take a fraction of the Pillars offline
+        with self.lock:
+            count = int(len(self.pillars) * fraction)
+            for pillar in self.random.sample(self.pillars, count):
+                self.offline.add(pillar['ownerAddress'])
+
+    def end_outage(self):
+        with self.lock:
+            self.offline = set()
+
+    def get_frontier_momentum(self):
+        with self.lock:
+            return {'height': self.height, 'timestamp': self.GENESIS_TIMESTAMP + self.height * 10}
+
+    def get_all_pillars(self, page_index, page_size):
+        with self.lock:
+            page = self.pillars[page_index * page_size:(page_index + 1) * page_size]
+            return {'count': len(self.pillars), 'list': json.loads(json.dumps(page))}
+
+    def get_frontier_reward(self, address, page_index=0, page_size=1):
+        with self.lock:
+            # Rewards are available up to the previous epoch, latest first
+            epochs = range(self.epoch - 1 - page_index * page_size, -1, -1)[:page_size]
+            return {'count': self.epoch, 'list': [{'epoch': epoch, 'znnAmount': 1000000000 + epoch % 7 * 10000000, 'qsrAmount': 0}
+                                                  for epoch in epochs]}
+
+    def __create_pillar(self):
+        i = self.next_id
+        self.next_id = self.next_id + 1
+        return {'name': f'Pillar{i}', 'ownerAddress': f'z1qqsimulator{i:024d}',
+                'currentStats': {'producedMomentums': 0, 'expectedMomentums': 0},
+                'weight': self.random.randrange(15000, 500000) * 100000000,
+                'giveMomentumRewardPercentage': self.random.randrange(0, 101, 5),
+                'giveDelegateRewardPercentage': self.random.randrange(0, 101, 5), 'rank': 0}
+
+    def __update_ranks(self):
+        self.pillars.sort(key=lambda pillar: -pillar['weight'])
+        for rank, pillar in enumerate(self.pillars):
+            pillar['rank'] = rank
+
+    def __rollover_epoch(self):
+        self.epoch = self.epoch + 1
+        for pillar in self.pillars:
+            pillar['currentStats'] = {'producedMomentums': 0, 'expectedMomentums': 0}
+
+
+class SimulatorServer(object):
+    # Serves the node JSON-RPC methods used by NodeRpcWrapper, the Telegram sendMessage,
+    # editMessageText and getUpdates methods and Discord webhooks from a NetworkSimulator
+
+    def __init__(self, simulator, host='127.0.0.1', port=0, latency=0, telegram_messages_per_second=None):
+        self.simulator = simulator
+        self.latency = latency
+        self.telegram_messages_per_second = telegram_messages_per_second
+        self.lock = threading.Lock()
+        self.counts = {'rpc_requests': 0, 'rpc_calls': 0, 'telegram_send': 0, 'telegram_edit': 0,
+                       'telegram_rate_limited': 0, 'discord': 0}
+        self.messages = []
+        self.updates = []
+        self.telegram_window = []
+        self.server = ThreadingHTTPServer((host, port), self.__create_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def rpc(self, request):
+        method = request.get('method')
+        params = request.get('params', [])
+        if method == 'ledger.getFrontierMomentum':
+            result = self.simulator.get_frontier_momentum()
+        elif method == 'embedded.pillar.getAll':
+            result = self.simulator.get_all_pillars(*params)
+        elif method == 'embedded.pillar.getFrontierRewardByPage':
+            result = self.simulator.get_frontier_reward(*params)
+        else:
+            return {'jsonrpc': '2.0', 'id': request.get('id'),
+                    'error': {'code': -32601, 'message': f'Method not found: {method}'}}
+        return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': result}
+
+    def add_telegram_message(self, chat_id, text):
+        # Queue a message from a user to the bot
+        with self.lock:
+            self.updates.append({'update_id': len(self.updates) + 1,
+                                 'message': {'chat': {'id': chat_id, 'type': 'private'}, 'text': text}})
+
+    def telegram(self, method, params):
+        with self.lock:
+            if method == 'getUpdates':
+                offset = int(params.get('offset', 0))
+                return 200, {'ok': True, 'result': [u for u in self.updates if u['update_id'] >= offset]}
+
+            # Reject messages above the configured rate like the Bot API does
+            if self.telegram_messages_per_second is not None:
+                now = time.monotonic()
+                self.telegram_window = [t for t in self.telegram_window if now - t < 1]
+                if len(self.telegram_window) >= self.telegram_messages_per_second:
+                    self.counts['telegram_rate_limited'] += 1
+                    return 429, {'ok': False, 'error_code': 429, 'parameters': {'retry_after': 1}}
+                self.telegram_window.append(now)
+
+            if method == 'sendMessage':
+                self.counts['telegram_send'] += 1
+            elif method == 'editMessageText':
+                self.counts['telegram_edit'] += 1
+            else:
+                return 404, {'ok': False, 'error_code': 404, 'description': 'Not Found'}
+            self.messages.append(('telegram', method, params.get('chat_id'), params.get('text')))
+        return 200, {'ok': True, 'result': {}}
+
+    def discord(self, body):
+        with self.lock:
+            self.counts['discord'] += 1
+            self.messages.append(('discord', 'webhook', None, body.get('content')))
+        return 204, None
+
+    def get_counts(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def __create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                u = urlsplit(self.path)
+                params = {key: values[0] for key, values in parse_qs(u.query).items()}
+                if u.path.startswith('/bot'):
+                    self.__send(*server.telegram(u.path.split('/')[-1], params))
+                else:
+                    self.__send(404, None)
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                try:
+                    body = json.loads(self.rfile.read(length) or b'null')
+                except ValueError:
+                    return self.__send(400, None)
+                if server.latency > 0:
+                    time.sleep(server.latency)
+
+                if self.path.startswith('/bot'):
+                    self.__send(*server.telegram(self.path.split('/')[-1], body))
+                elif self.path.startswith('/webhook'):
+                    self.__send(*server.discord(body))
+                elif isinstance(body, list):
+                    with server.lock:
+                        server.counts['rpc_requests'] += 1
+                        server.counts['rpc_calls'] += len(body)
+                    self.__send(200, [server.rpc(request) for request in body])
+                else:
+                    with server.lock:
+                        server.counts['rpc_requests'] += 1
+                        server.counts['rpc_calls'] += 1
+                    self.__send(200, server.rpc(body))
+
+            def __send(self, status_code, body):
+                data = b'' if body is None else json.dumps(body).encode()
+                self.send_response(status_code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
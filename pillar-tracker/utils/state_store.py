@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+import threading
+
+from utils.pillar import Pillar
+
+
+class StateStore(object):
+
+    def __init__(self, file_path):
+        self.connection = sqlite3.connect(
+            file_path, isolation_level=None, check_same_thread=False)
+        self.lock = threading.Lock()
+
+        # Rows as last written, used to only write the rows that have changed
+        self.saved_pillars = {}
+        self.saved_momentum_status = {}
+        self.saved_values = {}
+
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS pillars (owner_address TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS momentum_status (owner_address TEXT PRIMARY KEY, name TEXT NOT NULL, missed_momentums INTEGER NOT NULL, is_producing INTEGER NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS rewards (owner_address TEXT NOT NULL, epoch INTEGER NOT NULL, znn_amount INTEGER NOT NULL, qsr_amount INTEGER NOT NULL, PRIMARY KEY (owner_address, epoch))')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS subscriptions (chat_id TEXT NOT NULL, owner_address TEXT NOT NULL, PRIMARY KEY (chat_id, owner_address))')
+            self.connection.execute(
+                'CREATE INDEX IF NOT EXISTS subscriptions_owner_address ON subscriptions (owner_address)')
+
+            # The missed momentum window was added to the momentum status later
+            columns = [r[1] for r in self.connection.execute('PRAGMA table_info(momentum_status)')]
+            if 'window' not in columns:
+                self.connection.execute(
+                    "ALTER TABLE momentum_status ADD COLUMN window TEXT NOT NULL DEFAULT '[]'")
+
+    def is_empty(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM kv').fetchone()[0] == 0
+
+    def load(self):
+        # Returns the state in the same format as the former JSON cache files
+        with self.lock:
+            values = {}
+            for key, value in self.connection.execute('SELECT key, value FROM kv'):
+                values[key] = value
+            self.saved_values = dict(values)
+
+            state = {'pillar_data': None, 'epoch_data': None, 'momentum_status_data': None,
+                     'node_status': {'height': 0, 'error': False}, 'pinned_stats': None}
+
+            if 'pillar_data_timestamp' in values:
+                pillars = {}
+                self.saved_pillars = {}
+                for owner_address, data in self.connection.execute('SELECT owner_address, data FROM pillars'):
+                    pillars[owner_address] = Pillar.from_list(json.loads(data))
+                    self.saved_pillars[owner_address] = data
+                state['pillar_data'] = {'pillars': pillars, 'timestamp': json.loads(
+                    values['pillar_data_timestamp'])}
+
+            if 'momentum_status_timestamp' in values:
+                momentum_status = {}
+                self.saved_momentum_status = {}
+                for row in self.connection.execute('SELECT owner_address, name, missed_momentums, is_producing, window FROM momentum_status'):
+                    momentum_status[row[0]] = {'name': row[1], 'missedMomentums': row[2], 'isProducing': bool(row[3]),
+                                               'window': json.loads(row[4])}
+                    self.saved_momentum_status[row[0]] = row[1:]
+                state['momentum_status_data'] = {'data': momentum_status, 'timestamp': json.loads(
+                    values['momentum_status_timestamp'])}
+
+            if 'epoch_data' in values:
+                state['epoch_data'] = json.loads(values['epoch_data'])
+            if 'node_status' in values:
+                state['node_status'] = json.loads(values['node_status'])
+            if 'pinned_stats' in values:
+                state['pinned_stats'] = json.loads(values['pinned_stats'])
+            return state
+
+    def save(self, state):
+        # Write all changed rows in one transaction
+        with self.lock:
+            pillar_rows = {}
+            if state['pillar_data'] is not None:
+                for owner_address, pillar in state['pillar_data']['pillars'].items():
+                    pillar_rows[owner_address] = json.dumps(pillar.to_list())
+
+            momentum_status_rows = {}
+            if state['momentum_status_data'] is not None:
+                for owner_address, status in state['momentum_status_data']['data'].items():
+                    momentum_status_rows[owner_address] = (
+                        status['name'], status['missedMomentums'], int(status['isProducing']),
+                        json.dumps(status.get('window', [])))
+
+            values = {'node_status': json.dumps(state['node_status'])}
+            if state['pillar_data'] is not None:
+                values['pillar_data_timestamp'] = json.dumps(
+                    state['pillar_data']['timestamp'])
+            if state['epoch_data'] is not None:
+                values['epoch_data'] = json.dumps(state['epoch_data'])
+            if state['momentum_status_data'] is not None:
+                values['momentum_status_timestamp'] = json.dumps(
+                    state['momentum_status_data']['timestamp'])
+            if state.get('pinned_stats') is not None:
+                values['pinned_stats'] = json.dumps(state['pinned_stats'])
+
+            self.connection.execute('BEGIN')
+            try:
+                if state['pillar_data'] is not None:
+                    self.__upsert_rows('pillars', 'INSERT OR REPLACE INTO pillars (owner_address, data) VALUES (?, ?)',
+                                       self.saved_pillars, pillar_rows)
+                if state['momentum_status_data'] is not None:
+                    self.__upsert_rows('momentum_status', 'INSERT OR REPLACE INTO momentum_status (owner_address, name, missed_momentums, is_producing, window) VALUES (?, ?, ?, ?, ?)',
+                                       self.saved_momentum_status, momentum_status_rows)
+                self.__upsert_rows('kv', 'INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)',
+                                   self.saved_values, values, delete=False)
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+
+                # The saved rows are unknown after a rollback, write everything on the next save
+                self.saved_pillars = {}
+                self.saved_momentum_status = {}
+                self.saved_values = {}
+                raise
+
+            if state['pillar_data'] is not None:
+                self.saved_pillars = pillar_rows
+            if state['momentum_status_data'] is not None:
+                self.saved_momentum_status = momentum_status_rows
+            self.saved_values.update(values)
+
+    def load_rewards(self):
+        # Returns the reward history of every Pillar by epoch
+        with self.lock:
+            rewards = {}
+            for owner_address, epoch, znn_amount, qsr_amount in self.connection.execute(
+                    'SELECT owner_address, epoch, znn_amount, qsr_amount FROM rewards'):
+                rewards.setdefault(owner_address, {})[epoch] = (znn_amount, qsr_amount)
+            return rewards
+
+    def save_rewards(self, rows, min_epoch):
+        # Add the (owner address, epoch, ZNN amount, QSR amount) rows and remove the epochs before min_epoch
+        with self.lock:
+            self.connection.execute('BEGIN')
+            try:
+                self.connection.executemany(
+                    'INSERT OR REPLACE INTO rewards (owner_address, epoch, znn_amount, qsr_amount) VALUES (?, ?, ?, ?)', rows)
+                self.connection.execute('DELETE FROM rewards WHERE epoch < ?', (min_epoch,))
+                self.connection.execute('COMMIT')
+            except BaseException:
+                self.connection.execute('ROLLBACK')
+                raise
+
+    def load_subscriptions(self):
+        # Returns the (chat ID, owner address) pairs of all watchlists
+        with self.lock:
+            return self.connection.execute('SELECT chat_id, owner_address FROM subscriptions').fetchall()
+
+    def add_subscription(self, chat_id, owner_address):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR IGNORE INTO subscriptions (chat_id, owner_address) VALUES (?, ?)', (chat_id, owner_address))
+
+    def remove_subscription(self, chat_id, owner_address):
+        with self.lock:
+            self.connection.execute(
+                'DELETE FROM subscriptions WHERE chat_id = ? AND owner_address = ?', (chat_id, owner_address))
+
+    def get_value(self, key, default=None):
+        # Values that are not part of the state, stored next to it
+        with self.lock:
+            row = self.connection.execute('SELECT value FROM kv WHERE key = ?', (key,)).fetchone()
+            return json.loads(row[0]) if row is not None else default
+
+    def set_value(self, key, value):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def import_json_files(self, files):
+        # Import the cache files that were used before the state store
+        state = {'pillar_data': None, 'epoch_data': None,
+                 'momentum_status_data': None, 'node_status': {'height': 0, 'error': False}}
+        for key, file_key in [('pillar_data', 'pillar'), ('epoch_data', 'epoch'),
+                              ('momentum_status_data', 'momentum_status'), ('node_status', 'node_status')]:
+            if os.path.exists(files[file_key]) and os.stat(files[file_key]).st_size != 0:
+                with open(files[file_key]) as f:
+                    state[key] = json.load(f)
+        if state['pillar_data'] is not None:
+            state['pillar_data']['pillars'] = {owner_address: Pillar.from_rpc(pillar)
+                                               for owner_address, pillar in state['pillar_data']['pillars'].items()}
+        self.save(state)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __upsert_rows(self, table, sql, saved_rows, rows, delete=True):
+        for key, row in rows.items():
+            if saved_rows.get(key) != row:
+                if isinstance(row, tuple):
+                    self.connection.execute(sql, (key,) + row)
+                else:
+                    self.connection.execute(sql, (key, row))
+        if delete:
+            # saved_rows can be empty before the first save, compare against the table then
+            if len(saved_rows) == 0:
+                saved_rows = dict.fromkeys(
+                    r[0] for r in self.connection.execute(f'SELECT owner_address FROM {table}'))
+            for key in saved_rows:
+                if key not in rows:
+                    self.connection.execute(
+                        f'DELETE FROM {table} WHERE owner_address = ?', (key,))
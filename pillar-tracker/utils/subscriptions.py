@@ -0,0 +1,141 @@
+import json
+
+import requests
+
+from utils.metrics import metrics
+
+
+class SubscriptionManager(object):
+    # Pillar watchlists of Telegram users. Users manage their watchlist by messaging the bot:
+    #
+    # /watch <owner address or Pillar name>
+    # /unwatch <owner address or Pillar name>
+    # /list
+    #
+    # The watchlists are indexed by owner address, so the subscribers of an event are found
+    # without going through all watchlists.
+    HELP_MESSAGE = ('Get a message when your Pillars stop or resume producing momentums, are renamed or change their reward sharing.\n\n'
+                    '/watch <owner address or Pillar name> - watch a Pillar\n'
+                    '/unwatch <owner address or Pillar name> - stop watching a Pillar\n'
+                    '/list - show your watched Pillars')
+
+    def __init__(self, telegram, store, dispatcher, events=('inactive', 'active', 'name_changed', 'reward_share_changed'),
+                 max_watchlist_size=50):
+        self.telegram = telegram
+        self.store = store
+        self.dispatcher = dispatcher
+        self.events = events
+        self.max_watchlist_size = max_watchlist_size
+
+        # Subscribers per owner address and owner addresses per subscriber
+        self.subscribers = {}
+        self.watchlists = {}
+        for chat_id, owner_address in store.load_subscriptions():
+            self.subscribers.setdefault(owner_address, set()).add(chat_id)
+            self.watchlists.setdefault(chat_id, set()).add(owner_address)
+
+        # ID of the next Telegram update to process
+        self.update_offset = store.get_value('telegram_update_offset', 0)
+
+    def get_subscribers(self, owner_address):
+        return self.subscribers.get(owner_address, set())
+
+    def get_watchlist(self, chat_id):
+        return self.watchlists.get(chat_id, set())
+
+    def watch(self, chat_id, owner_address):
+        self.store.add_subscription(chat_id, owner_address)
+        self.subscribers.setdefault(owner_address, set()).add(chat_id)
+        self.watchlists.setdefault(chat_id, set()).add(owner_address)
+
+    def unwatch(self, chat_id, owner_address):
+        self.store.remove_subscription(chat_id, owner_address)
+        for index, key, value in ((self.subscribers, owner_address, chat_id), (self.watchlists, chat_id, owner_address)):
+            index.get(key, set()).discard(value)
+            if len(index.get(key, ())) == 0:
+                index.pop(key, None)
+
+    def fan_out(self, notifications):
+        # Returns a direct message for every subscriber of the Pillar of each channel notification.
+        # Notification keys start with the event type and the owner address.
+        direct_notifications = []
+        for n in notifications:
+            if n['sink'] != 'telegram' or n.get('direct', False):
+                continue
+            parts = n['key'].split(':')
+            if len(parts) < 2 or parts[0] not in self.events:
+                continue
+            for chat_id in self.subscribers.get(parts[1], ()):
+                direct_notifications.append(dict(n, target=chat_id, direct=True, critical=False))
+        metrics.inc('subscriber_notifications_total', value=len(direct_notifications))
+        return direct_notifications
+
+    def process_commands(self, pillars):
+        # Handle the commands received since the last call
+        try:
+            r = self.telegram.bot_get_updates(self.update_offset)
+        except requests.exceptions.RequestException as e:
+            print(f'Could not get Telegram updates: {repr(e)}')
+            return
+        if r.status_code != 200:
+            print(f'Could not get Telegram updates: {r.status_code}')
+            return
+        try:
+            updates = json.loads(r.text)['result']
+        except (ValueError, KeyError):
+            print('Could not get Telegram updates: Invalid response')
+            return
+        if len(updates) == 0:
+            return
+
+        for update in updates:
+            message = update.get('message')
+            if message is not None and 'text' in message and 'chat' in message:
+                reply = self.__handle_command(str(message['chat']['id']), message['text'].strip(), pillars)
+                if reply is not None:
+                    self.dispatcher.dispatch({'key': None, 'sink': 'telegram', 'target': str(message['chat']['id']),
+                                              'message': reply, 'description': 'Subscription command reply',
+                                              'direct': True, 'critical': True})
+        self.update_offset = updates[-1]['update_id'] + 1
+        self.store.set_value('telegram_update_offset', self.update_offset)
+
+    def __handle_command(self, chat_id, text, pillars):
+        parts = text.split(maxsplit=1)
+        if len(parts) == 0 or not parts[0].startswith('/'):
+            return None
+        command = parts[0].split('@')[0].lower()
+        argument = parts[1].strip() if len(parts) > 1 else ''
+
+        if command in ('/start', '/help'):
+            return self.HELP_MESSAGE
+
+        if command == '/list':
+            watchlist = self.get_watchlist(chat_id)
+            if len(watchlist) == 0:
+                return 'You are not watching any Pillars.'
+            names = sorted(pillars[a].name if a in pillars else a for a in watchlist)
+            return 'Watched Pillars:\n' + '\n'.join(names)
+
+        if command in ('/watch', '/unwatch'):
+            owner_address = self.__find_pillar(argument, pillars)
+            if owner_address is None:
+                return f'Pillar not found: {argument}'
+            name = pillars[owner_address].name if owner_address in pillars else owner_address
+            if command == '/unwatch':
+                self.unwatch(chat_id, owner_address)
+                return f'Stopped watching {name}.'
+            if owner_address not in self.get_watchlist(chat_id) and len(self.get_watchlist(chat_id)) >= self.max_watchlist_size:
+                return f'You can watch at most {self.max_watchlist_size} Pillars.'
+            self.watch(chat_id, owner_address)
+            return f'Watching {name}.'
+        return None
+
+    def __find_pillar(self, argument, pillars):
+        if len(argument) == 0:
+            return None
+        if argument in pillars or argument in self.subscribers:
+            return argument
+        for owner_address, pillar in pillars.items():
+            if pillar.name.lower() == argument.lower():
+                return owner_address
+        return None